@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+import io
+import os
+import json
+import time
+import multiprocessing
+import cwrap
+import gcwidget
+
+# Renders a sequence of instrument data snapshots to PNG files using a pool
+# of worker processes. Every worker loads its own GlassCockpit once; frames
+# come back (and are written) in the order of the snapshots.
+class BatchRenderer(object):
+	_worker = None
+
+	def __init__(self, config, sprite_step = None):
+		self._config = config
+		self._sprite_cache = None
+		if sprite_step is not None:
+			self._sprite_cache = cwrap.CairoSpriteCache(step_deg = sprite_step, prefill_count = 0)
+		# Cached group images would make a frame depend on the snapshots the
+		# worker rendered before it; every frame is rendered exactly instead.
+		self._glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext, group_thresholds = { })
+
+	def render_png(self, snapshot):
+		screen = cwrap.CairoContext.create(self._glasscockpit.screen_dimension, sprite_cache = self._sprite_cache)
+		self._glasscockpit.feed_data(snapshot)
+		self._glasscockpit.render(screen)
+		png_data = io.BytesIO()
+		screen.write_to_png(png_data)
+		return png_data.getvalue()
+
+	@classmethod
+	def _initialize_worker(cls, config, sprite_step):
+		cls._worker = cls(config, sprite_step = sprite_step)
+
+	@classmethod
+	def _render_worker(cls, snapshot):
+		return cls._worker.render_png(snapshot)
+
+	@staticmethod
+	def read_snapshots(filename):
+		# One JSON object with complete instrument data per line
+		with open(filename) as f:
+			for line in f:
+				line = line.strip()
+				if line != "":
+					yield json.loads(line)
+
+	@classmethod
+	def run(cls, config, snapshots, output_pattern, processes = None, chunksize = 4, sprite_step = None):
+		if processes is None:
+			processes = os.cpu_count() or 1
+		t0 = time.time()
+		frame_count = 0
+		with multiprocessing.Pool(processes, initializer = cls._initialize_worker, initargs = (config, sprite_step)) as pool:
+			t_start = time.time()
+			print("Started %d worker processes in %.1f s" % (processes, t_start - t0))
+			for png_data in pool.imap(cls._render_worker, snapshots, chunksize = chunksize):
+				with open(output_pattern % (frame_count), "wb") as f:
+					f.write(png_data)
+				frame_count += 1
+				if (frame_count % 100) == 0:
+					tdiff = time.time() - t_start
+					print("%d frames rendered, %.1f fps" % (frame_count, frame_count / tdiff))
+		tdiff = time.time() - t_start
+		if frame_count > 0:
+			print("%d frames rendered in %.1f s: %.1f fps" % (frame_count, tdiff, frame_count / tdiff))
+		return frame_count
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+import json
+import math
+import socket
+import threading
+import collections
+from InstrumentCodec import InstrumentCodec, DecodeException
+
+FlightDataSnapshot = collections.namedtuple("FlightDataSnapshot", [ "sequence", "data" ])
+
+# Receives instrument data from the simulator over UDP on a dedicated thread.
+# Every datagram is a (possibly partial) update of the nested instrument data
+# that is merged into the receiver's own working copy, the back buffer. Once
+# all datagrams that are queued in the socket have been merged, a complete
+# copy is published as the front buffer by replacing a single reference. The
+# render loop only ever reads that reference, so it never waits for the
+# network and always gets the newest sample; published data is never modified
+# again and can be handed to GlassCockpit.feed_data() as is.
+#
+# Datagrams are either JSON objects that may carry only the values that
+# changed or complete InstrumentCodec packets, which are decoded straight
+# into the back buffer.
+class FlightDataReceiver(object):
+	_RESTART_DISTANCE = 1000
+
+	def __init__(self, address, initial_data = None, wire_format = "json"):
+		self._back = self._copy_tree(initial_data or { })
+		if wire_format == "json":
+			self._decode = self._decode_json
+		elif wire_format == "binary":
+			self._decode = self._decode_binary
+			self._values = InstrumentCodec.create_values()
+			self._bindings = InstrumentCodec.bind(self._back)
+		else:
+			raise Exception("Unsupported wire format: %s" % (wire_format))
+		self._front = FlightDataSnapshot(sequence = 0, data = self._copy_tree(self._back))
+		self._consumed_sequence = 0
+		self._last_packet_sequence = None
+		self._stats = collections.Counter()
+		(host, _, port) = address.rpartition(":")
+		self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self._socket.bind((host or "0.0.0.0", int(port)))
+		self._socket.settimeout(0.5)
+		self._running = True
+		self._thread = threading.Thread(target = self._receive_worker, daemon = True)
+		self._thread.start()
+
+	@property
+	def address(self):
+		return self._socket.getsockname()
+
+	@property
+	def stats(self):
+		return dict(self._stats)
+
+	@staticmethod
+	def _decode_json(packet):
+		update = json.loads(packet.decode("utf-8"))
+		if not isinstance(update, dict):
+			raise DecodeException("Packet is no JSON object.")
+		return (update.pop("seq", None), update)
+
+	def _decode_binary(self, packet):
+		sequence = InstrumentCodec.decode_into(packet, self._values)
+		if not all(math.isfinite(value) for value in self._values):
+			raise DecodeException("Packet contains values that are not finite.")
+		return (sequence, None)
+
+	@classmethod
+	def _copy_tree(cls, data):
+		if isinstance(data, dict):
+			return { key: cls._copy_tree(value) for (key, value) in data.items() }
+		elif isinstance(data, list):
+			return [ cls._copy_tree(value) for value in data ]
+		return data
+
+	@classmethod
+	def _compatible(cls, current, update):
+		# Updates may add values, but never change the type or shape of ones
+		# the back buffer already has; numbers have to be finite.
+		if isinstance(current, dict):
+			return isinstance(update, dict) and all((key not in current) or cls._compatible(current[key], value) for (key, value) in update.items())
+		elif isinstance(current, list):
+			return isinstance(update, list) and (len(update) == len(current)) and all(cls._compatible(old, new) for (old, new) in zip(current, update))
+		elif isinstance(current, (int, float)) and not isinstance(current, bool):
+			return isinstance(update, (int, float)) and (not isinstance(update, bool)) and math.isfinite(update)
+		return type(update) == type(current)
+
+	@classmethod
+	def _merge(cls, target, update):
+		for (key, value) in update.items():
+			if isinstance(value, dict) and isinstance(target.get(key), dict):
+				cls._merge(target[key], value)
+			else:
+				target[key] = cls._copy_tree(value)
+
+	def _process_packet(self, packet):
+		try:
+			(sequence, update) = self._decode(packet)
+		except ValueError:
+			self._stats["malformed"] += 1
+			return False
+		if (sequence is not None) and ((not isinstance(sequence, int)) or isinstance(sequence, bool)):
+			self._stats["malformed"] += 1
+			return False
+		if (update is not None) and (not self._compatible(self._back, update)):
+			self._stats["malformed"] += 1
+			return False
+
+		# UDP may reorder datagrams; a sender that numbers its packets gets
+		# stale ones discarded instead of briefly rewinding the instruments.
+		# A sequence number far behind the last one means the sender was
+		# restarted.
+		if sequence is not None:
+			if (self._last_packet_sequence is not None) and (self._last_packet_sequence - self._RESTART_DISTANCE < sequence <= self._last_packet_sequence):
+				self._stats["out_of_order"] += 1
+				return False
+			self._last_packet_sequence = sequence
+		if update is not None:
+			self._merge(self._back, update)
+		else:
+			InstrumentCodec.values_to_data(self._values, self._back, self._bindings)
+		self._stats["packets"] += 1
+		return True
+
+	def _receive_worker(self):
+		while self._running:
+			try:
+				packet = self._socket.recv(65536)
+			except socket.timeout:
+				continue
+			except OSError:
+				break
+
+			# Drain whatever else arrived in the meantime before publishing,
+			# so a burst of datagrams results in a single snapshot.
+			updated = self._receive_packet(packet)
+			self._socket.setblocking(False)
+			try:
+				while True:
+					updated = self._receive_packet(self._socket.recv(65536)) or updated
+					self._stats["coalesced"] += 1
+			except (BlockingIOError, InterruptedError):
+				pass
+			except OSError:
+				break
+			finally:
+				self._socket.settimeout(0.5)
+
+			if updated:
+				self._front = FlightDataSnapshot(sequence = self._front.sequence + 1, data = self._copy_tree(self._back))
+				self._stats["published"] += 1
+
+	def _receive_packet(self, packet):
+		# Whatever a datagram contains, it must not end reception
+		try:
+			return self._process_packet(packet)
+		except Exception:
+			self._stats["errors"] += 1
+			return False
+
+	def latest(self):
+		return self._front
+
+	def poll(self):
+		# Returns the newest snapshot's data if there has been one since the
+		# last call, None otherwise.
+		snapshot = self._front
+		if snapshot.sequence == self._consumed_sequence:
+			return None
+		self._consumed_sequence = snapshot.sequence
+		return snapshot.data
+
+	def shutdown(self):
+		self._running = False
+		self._thread.join()
+		self._socket.close()
+
+	def __str__(self):
+		return "FlightDataReceiver<%s:%d, %s>" % (self.address[0], self.address[1], ", ".join("%s %d" % (key, value) for (key, value) in sorted(self._stats.items())))
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+import os
+import math
+import stat
+import time
+import array
+import threading
+import socketserver
+from geo import Vector2d, Box2d
+from gcwidget.Color import Color
+
+# Per-frame render times of the most recent frames in a ring buffer, plus
+# counters that cover the whole run. The render thread only stores a number
+# and increments counters, it never takes a lock; readers (the telemetry
+# socket, the overlay) copy the ring and do all the sorting themselves. A
+# reader may see a frame that is being recorded concurrently as either the
+# old or the new value, which does not matter for statistics.
+class FrameTelemetry(object):
+	_OVERLAY_FONT = ("monospace", 14, Color.from_rgb_int(0xf1c40f))
+	_OVERLAY_LINE_HEIGHT = 18
+	_OVERLAY_SIZE = Vector2d(330, 4 * 18 + 6)
+
+	def __init__(self, frametime, capacity = 600, overlay = False, overlay_position = None, overlay_interval = 0.5):
+		self._frametime = frametime
+		self._ring = array.array("d", bytes(8 * capacity))
+		self._capacity = capacity
+		self._frame_count = 0
+		self._total_time = 0
+		self._max_time = 0
+		self._missed_deadlines = 0
+		self._dropped_frames = 0
+		self._t_start = time.monotonic()
+		self._overlay = overlay
+		self._overlay_box = Box2d(base = overlay_position or Vector2d(10, 10), dimensions = self._OVERLAY_SIZE)
+		self._overlay_interval = overlay_interval
+		self._overlay_lines = [ ]
+		self._overlay_updated = None
+
+	@property
+	def frametime(self):
+		return self._frametime
+
+	@property
+	def overlay(self):
+		return self._overlay
+
+	@property
+	def overlay_box(self):
+		return self._overlay_box
+
+	def record(self, duration):
+		self._ring[self._frame_count % self._capacity] = duration
+		self._frame_count += 1
+		self._total_time += duration
+		if duration > self._max_time:
+			self._max_time = duration
+		if (self._frametime > 0) and (duration > self._frametime):
+			self._missed_deadlines += 1
+
+	def count_dropped(self, frame_count):
+		self._dropped_frames += frame_count
+
+	def snapshot(self):
+		frame_count = self._frame_count
+		window = sorted(self._ring[ : min(frame_count, self._capacity)])
+		return (frame_count, window)
+
+	@staticmethod
+	def _percentile(window, p):
+		if len(window) == 0:
+			return 0
+		return window[min(len(window) - 1, math.ceil(p / 100 * len(window)) - 1)]
+
+	def text(self):
+		# Prometheus text exposition format, readable by scrapers as well as
+		# by a human with netcat.
+		(frame_count, window) = self.snapshot()
+		lines = [
+			"# HELP pygc_frame_time_seconds Render time of the most recent %d frames." % (self._capacity),
+			"# TYPE pygc_frame_time_seconds summary",
+		]
+		for p in (50, 90, 95, 99, 100):
+			lines.append("pygc_frame_time_seconds{quantile=\"%s\"} %.6f" % (str(p / 100), self._percentile(window, p)))
+		lines += [
+			"pygc_frame_time_seconds_sum %.6f" % (self._total_time),
+			"pygc_frame_time_seconds_count %d" % (frame_count),
+			"# HELP pygc_frame_time_max_seconds Longest frame since start.",
+			"# TYPE pygc_frame_time_max_seconds gauge",
+			"pygc_frame_time_max_seconds %.6f" % (self._max_time),
+			"# HELP pygc_frame_budget_seconds Time available for rendering one frame.",
+			"# TYPE pygc_frame_budget_seconds gauge",
+			"pygc_frame_budget_seconds %.6f" % (self._frametime),
+			"# HELP pygc_missed_deadlines_total Frames that took longer than the frame budget.",
+			"# TYPE pygc_missed_deadlines_total counter",
+			"pygc_missed_deadlines_total %d" % (self._missed_deadlines),
+			"# HELP pygc_dropped_frames_total Frames that were skipped because rendering fell behind.",
+			"# TYPE pygc_dropped_frames_total counter",
+			"pygc_dropped_frames_total %d" % (self._dropped_frames),
+			"# HELP pygc_uptime_seconds Time since the renderer started.",
+			"# TYPE pygc_uptime_seconds gauge",
+			"pygc_uptime_seconds %.1f" % (time.monotonic() - self._t_start),
+		]
+		return "\n".join(lines) + "\n"
+
+	def update_overlay(self):
+		# Rebuilds the overlay text at a low rate so that it stays readable;
+		# returns True when it changed and the overlay area needs a redraw.
+		if not self._overlay:
+			return False
+		now = time.monotonic()
+		if (self._overlay_updated is not None) and (now - self._overlay_updated < self._overlay_interval):
+			return False
+		self._overlay_updated = now
+		(frame_count, window) = self.snapshot()
+		lines = [
+			"frame p50 %5.1f  p99 %5.1f ms" % (self._percentile(window, 50) * 1000, self._percentile(window, 99) * 1000),
+			"max window %5.1f  all %5.1f ms" % ((window[-1] if (len(window) > 0) else 0) * 1000, self._max_time * 1000),
+			"budget %.1f ms, %d frames" % (self._frametime * 1000, frame_count),
+			"missed %d, dropped %d" % (self._missed_deadlines, self._dropped_frames),
+		]
+		if lines == self._overlay_lines:
+			return False
+		self._overlay_lines = lines
+		return True
+
+	def draw_overlay(self, ctx):
+		if not self._overlay:
+			return
+		ctx.font_select(*self._OVERLAY_FONT)
+		pos = self._overlay_box.base + Vector2d(4, 4)
+		for line in self._overlay_lines:
+			ctx.text(pos, line, anchor = "tl")
+			pos += Vector2d(0, self._OVERLAY_LINE_HEIGHT)
+
+class _TelemetryRequestHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		# Plain clients get the metrics right away; HTTP clients send a
+		# request line first and get a minimal HTTP response.
+		self.connection.settimeout(0.2)
+		try:
+			request = self.rfile.readline()
+		except OSError:
+			request = b""
+		body = self.server.telemetry.text().encode("utf-8")
+		if request.startswith(b"GET "):
+			# The rest of the request has to be read, closing the socket with
+			# unread data resets the connection before the client sees the
+			# response.
+			self.connection.settimeout(1)
+			try:
+				while self.rfile.readline(65536).strip() != b"":
+					pass
+			except OSError:
+				return
+			header = "HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\n\r\n" % (len(body))
+			body = header.encode("ascii") + body
+		self.connection.settimeout(1)
+		self.wfile.write(body)
+
+class _TCPTelemetryServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class _UnixTelemetryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+# Serves FrameTelemetry.text() on a background thread, either on a Unix
+# socket ("unix:/path/to/socket") or on TCP ("port" or "host:port", which
+# binds to localhost unless a host is given).
+class TelemetryServer(object):
+	def __init__(self, telemetry, address):
+		if address.startswith("unix:"):
+			path = address[5:]
+			if os.path.exists(path):
+				# Only a stale socket of a previous run may be replaced
+				if not stat.S_ISSOCK(os.stat(path).st_mode):
+					raise Exception("Telemetry socket path %s exists and is not a socket." % (path))
+				os.unlink(path)
+			self._server = _UnixTelemetryServer(path, _TelemetryRequestHandler)
+		else:
+			(host, _, port) = address.rpartition(":")
+			self._server = _TCPTelemetryServer((host or "127.0.0.1", int(port)), _TelemetryRequestHandler)
+		self._server.telemetry = telemetry
+		self._address = address
+		self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+		self._thread.start()
+
+	@property
+	def address(self):
+		return self._address
+
+	def shutdown(self):
+		self._server.shutdown()
+		self._server.server_close()
@@ -1,14 +1,24 @@
 #!/usr/bin/python3
-import time
 import geo
 import gi
+import cwrap
+from StopWatch import Profiler
+from gcwidget.Tools import BoxTools
+from gcwidget.TiledRenderer import TiledRenderer
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, GObject, GLib
 
 class GCGTKApplication(Gtk.Window):
-	def __init__(self, glasscockpit, frametime_millis, data_callback = None, quit_callback = None):
+	def __init__(self, glasscockpit, frametime_millis, data_callback = None, quit_callback = None, sprite_cache = None, band_count = None, profiler = None, telemetry = None):
 		Gtk.Window.__init__(self)
 		self._glasscockpit = glasscockpit
+		self._profiler = profiler if (profiler is not None) else Profiler()
+		self._telemetry = telemetry
+		self._sprite_cache = sprite_cache
+		if band_count is None:
+			self._renderer = glasscockpit
+		else:
+			self._renderer = TiledRenderer(glasscockpit, band_count = band_count)
 		self._frametime_millis = frametime_millis
 		self._data_callback = data_callback
 		self._quit_callback = quit_callback
@@ -26,35 +36,52 @@ class GCGTKApplication(Gtk.Window):
 		self.set_position(Gtk.WindowPosition.CENTER)
 		self.show_all()
 		self._t0 = 0
-		self.on_frame()
+		GLib.timeout_add(self._frametime_millis, self.on_frame)
 
 	def on_keypress(self, wid, key):
 		if key.get_keycode().keycode == 9:
 			# ESC
 			self._quit_callback()
+		elif key.keyval == ord("p"):
+			if self._glasscockpit.profiler is not None:
+				self._glasscockpit.profiler.dump()
+			self._profiler.summary()
+			if self._sprite_cache is not None:
+				print(self._sprite_cache)
 
 	def _quit(self):
 		#Gtk.main_quit()
 		GLib.MainLoop().quit()
 
 	def on_frame(self, *args):
-		if self._data_callback is not None:
-			self._data_callback()
-#		self._glasscockpit.render(self._screen)
-		self._darea.queue_draw()
+		with self._profiler.span("tick"):
+			if self._data_callback is not None:
+				with self._profiler.span("data"):
+					self._data_callback()
+#			self._glasscockpit.render(self._screen)
+			# Only the areas of the screen whose content changed are
+			# invalidated; GTK merges them into the clip region of the next
+			# draw.
+			with self._profiler.span("damage"):
+				damage = self._glasscockpit.update_damage()
+			if (self._telemetry is not None) and self._telemetry.update_overlay():
+				damage = damage + [ self._telemetry.overlay_box ]
+			for box in damage:
+				self._darea.queue_draw_area(box.base.x, box.base.y, box.dimensions.x, box.dimensions.y)
+		return True
 
 	def on_draw(self, wid, cr):
 #		cr.set_source_surface(self._screen.surface, 10, 10)
 #		cr.paint()
-		self._t0 = time.time()
-		self._glasscockpit.render_cairo(cr)
-		t1 = time.time()
-		tdiff = t1 - self._t0
-		print("%.1f ms / %.1f fps" % (tdiff * 1000, 1 / tdiff))
-		GObject.timeout_add(self._frametime_millis, self.on_frame)
+		region = BoxTools.from_corners(*cr.clip_extents())
+		with self._profiler.span("draw") as draw_timer:
+			self._renderer.render_cairo(cr, region = [ region ], sprite_cache = self._sprite_cache)
+		if self._telemetry is not None:
+			self._telemetry.record(draw_timer.finishtime)
+			self._telemetry.draw_overlay(cwrap.CairoContext.wrap(self._glasscockpit.screen_dimension, cr))
 
 	@classmethod
-	def run(cls, glasscockpit, frametime_millis, data_callback = None):
+	def run(cls, glasscockpit, frametime_millis, data_callback = None, sprite_cache = None, band_count = None, profiler = None, telemetry = None):
 		mainloop = GLib.MainLoop()
-		app = cls(glasscockpit, frametime_millis, data_callback = data_callback, quit_callback = lambda: mainloop.quit())
+		app = cls(glasscockpit, frametime_millis, data_callback = data_callback, quit_callback = lambda: mainloop.quit(), sprite_cache = sprite_cache, band_count = band_count, profiler = profiler, telemetry = telemetry)
 		mainloop.run()
@@ -2,9 +2,11 @@
 import sys
 import enum
 import time
+import math
 import cwrap
 from geo import Vector2d, Box2d
-from StopWatch import StopWatch
+from gcwidget.Tools import BoxTools
+from StopWatch import StopWatch, Profiler
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
@@ -21,13 +23,41 @@ class MouseButtonAction(enum.IntEnum):
 	ButtonUp = 1
 
 class GlutApplication(object):
-	def __init__(self, glasscockpit, data_callback = None, fullscreen = False):
+	def __init__(self, glasscockpit, frametime_millis, data_callback = None, fullscreen = False, swap_interval = None, render_on_change = True, partial_redraw = False, profiler = None, telemetry = None):
+		self._frametime = frametime_millis / 1000
+		self._profiler = profiler if (profiler is not None) else Profiler()
+		self._telemetry = telemetry
+		self._render_on_change = render_on_change
+		self._partial_redraw = partial_redraw
+		self._pending_damage = [ ]
+		self._previous_damage = None
+		self._full_redraws = 0
+		self._redisplay_posted = False
 		self._data_callback = data_callback
-		self._screen_ctx = cwrap.OpenGLContext()
 		self._glasscockpit = glasscockpit
-		self._initialize_opengl(fullscreen = fullscreen)
+
+		# Layer images are decoded in the background while GLUT sets up the
+		# window; all textures are uploaded before the first frame. The
+		# layers have to be handed to preload() before the screen context
+		# is created, which would claim them otherwise.
+		preload = cwrap.OpenGLContext.preload()
+		self._screen_ctx = cwrap.OpenGLContext(glasscockpit.screen_dimension)
+		with StopWatch("OpenGL initialization", noisy = True):
+			self._initialize_opengl(fullscreen = fullscreen)
+		with StopWatch("Texture preloading", noisy = True):
+			prepared = self._screen_ctx.upload_preloaded(preload)
+		if prepared is not None:
+			print("Preloaded %s" % (prepared.atlas))
+			for (phase, duration) in prepared.timings.items():
+				print("    %-20s %.0f ms" % (phase, duration * 1000))
+		if swap_interval is not None:
+			self._set_swap_interval(swap_interval)
 		self._fps_timesum = 0
 		self._fps_timecnt = 0
+		self._skipped_frames = 0
+		self._idle_ticks = 0
+		self._next_deadline = time.time()
+		glutTimerFunc(0, self._gl_timer, 0)
 
 	def _initialize_opengl(self, fullscreen = False):
 		glutInit(1, "None")
@@ -40,24 +70,15 @@ class GlutApplication(object):
 			glutFullScreen()
 
 		glutDisplayFunc(self._gl_display)
-		glutIdleFunc(self._gl_idle)
 		glutKeyboardFunc(self._gl_keyboard)
 		glutReshapeFunc(self._gl_reshape)
 
-		glViewport(0, 0, self._glasscockpit.screen_dimension.x, self._glasscockpit.screen_dimension.y)
-		glClearColor(0.5, 0.5, 0.5, 0)
-		glClear(GL_COLOR_BUFFER_BIT)
-
-		glEnable(GL_TEXTURE_2D)
-		glEnable(GL_ALPHA_TEST)
-
-		glEnable(GL_BLEND)
-		glBlendEquation(GL_FUNC_ADD)
-		glBlendFunc(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+		self._screen_ctx.initialize_state()
 
 		glMatrixMode(GL_PROJECTION)
 		glLoadIdentity()
 		glOrtho(0, self._glasscockpit.screen_dimension.x, self._glasscockpit.screen_dimension.y, 0, -1, 1)
+		self._screen_ctx.state.matrix_modified(GL_PROJECTION)
 
 	def _gl_reshape(self, width, height):
 		aspect = self._glasscockpit.screen_dimension.ratio
@@ -65,11 +86,67 @@ class GlutApplication(object):
 		window_width = int(min(width, max_width))
 		window_height = round(window_width / aspect)
 
-		glViewport((width - window_width) // 2, (height - window_height) // 2, window_width, window_height)
+		self._screen_ctx.state.viewport((width - window_width) // 2, (height - window_height) // 2, window_width, window_height)
+		self._screen_ctx.state.set_scissor(None)
 		glClear(GL_COLOR_BUFFER_BIT)
 
-	def _gl_idle(self):
-		self._gl_display()
+		# Both buffers still hold frames drawn at the old size, the next
+		# frames have to repaint everything including the letterbox bars.
+		self._full_redraws = 2
+
+	def _set_swap_interval(self, interval):
+		# 0 disables vsync, 1 syncs every buffer swap to the vertical retrace.
+		# Which entry point exists depends on the GLX implementation.
+		try:
+			from OpenGL.GLX.MESA.swap_control import glXSwapIntervalMESA
+			if bool(glXSwapIntervalMESA):
+				glXSwapIntervalMESA(interval)
+				return True
+		except ImportError:
+			pass
+		try:
+			from OpenGL.GLX.SGI.swap_control import glXSwapIntervalSGI
+			if bool(glXSwapIntervalSGI) and (interval > 0):
+				glXSwapIntervalSGI(interval)
+				return True
+		except ImportError:
+			pass
+		print("Unable to set swap interval %d, no swap control extension available." % (interval))
+		return False
+
+	def _schedule_next_frame(self):
+		now = time.time()
+		self._next_deadline += self._frametime
+		if (self._frametime > 0) and (now > self._next_deadline + self._frametime):
+			# We fell behind by more than a frame. Rather than trying to catch
+			# up by rendering back-to-back, drop the missed frames.
+			missed = math.floor((now - self._next_deadline) / self._frametime)
+			self._skipped_frames += missed
+			if self._telemetry is not None:
+				self._telemetry.count_dropped(missed)
+			self._next_deadline += missed * self._frametime
+		delay_millis = max(0, round((self._next_deadline - now) * 1000))
+		glutTimerFunc(delay_millis, self._gl_timer, 0)
+
+	def _gl_timer(self, value):
+		try:
+			with self._profiler.span("tick"):
+				if self._data_callback is not None:
+					with self._profiler.span("data"):
+						self._data_callback()
+				with self._profiler.span("damage"):
+					damage = self._glasscockpit.update_damage()
+				if (self._telemetry is not None) and self._telemetry.update_overlay():
+					damage = damage + [ self._telemetry.overlay_box ]
+			if (not self._render_on_change) or (len(damage) > 0):
+				self._pending_damage += damage
+				self._redisplay_posted = True
+				glutPostRedisplay()
+			else:
+				self._idle_ticks += 1
+			self._schedule_next_frame()
+		except KeyboardInterrupt:
+			sys.exit(0)
 
 	def _draw_test_square(self, box, zvalue = 0):
 		vertices = list(box)
@@ -86,14 +163,16 @@ class GlutApplication(object):
 
 	def _gl_display(self):
 		try:
-			t0 = time.time()
-			self._gl_display_gc()
-			t1 = time.time()
-			self._fps_timesum += (t1 - t0)
+			with self._profiler.span("frame") as frame_timer:
+				self._gl_display_gc()
+			self._fps_timesum += frame_timer.finishtime
+			if self._telemetry is not None:
+				self._telemetry.record(frame_timer.finishtime)
 			self._fps_timecnt += 1
 			if self._fps_timecnt == 10:
 				t = self._fps_timesum / self._fps_timecnt
-				print("Average %.1f ms = %.1f fps (over %d frames)" % (t * 1000, 1 / t, self._fps_timecnt))
+				gl_calls = self._screen_ctx.state.last_frame
+				print("Average %.1f ms = %.1f fps (over %d frames), %d GL calls per frame (%d redundant skipped), %d frames dropped, %d unchanged frames not rendered" % (t * 1000, 1 / t, self._fps_timecnt, gl_calls.calls, gl_calls.skipped, self._skipped_frames, self._idle_ticks))
 				self._fps_timecnt = 0
 				self._fps_timesum = 0
 		except GLError as e:
@@ -102,22 +181,56 @@ class GlutApplication(object):
 		except KeyboardInterrupt:
 			sys.exit(0)
 
-	def _gl_display_gc(self):
-		self._data_callback()
-		glMatrixMode(GL_MODELVIEW)
-		glLoadIdentity()
+	def _redraw_region(self):
+		# Returns the screen box that needs to be drawn this frame or None for
+		# the whole screen. A display callback that we did not request is an
+		# expose event and always repaints everything.
+		(damage, self._pending_damage) = (self._pending_damage, [ ])
+		if not self._redisplay_posted:
+			damage = None
+		self._redisplay_posted = False
+		if self._full_redraws > 0:
+			self._full_redraws -= 1
+			damage = None
+		if (not self._partial_redraw) or (damage is None) or (self._previous_damage is None):
+			self._previous_damage = damage
+			return None
+
+		# With double buffering the back buffer holds the frame before the
+		# previous one, so its damage has to be repainted as well.
+		region = None
+		for box in damage + self._previous_damage:
+			region = BoxTools.union(region, box)
+		self._previous_damage = damage
+		return region
 
-		glClear(GL_COLOR_BUFFER_BIT)
-		self._glasscockpit.render_opengl(self._screen_ctx)
+	def _gl_display_gc(self):
+		self._screen_ctx.state.load_identity(GL_MODELVIEW)
+
+		region = self._redraw_region()
+		self._screen_ctx.set_region(region)
+		self._screen_ctx.clear()
+		with self._profiler.span("render"):
+			self._glasscockpit.render_opengl(self._screen_ctx, region = None if (region is None) else [ region ])
+		if self._telemetry is not None:
+			self._telemetry.draw_overlay(self._screen_ctx)
+		with self._profiler.span("flush"):
+			self._screen_ctx.end_frame()
+		self._screen_ctx.set_region(None)
 #		self._draw_test_square(Box2d(Vector2d(0, 0), Vector2d(100, 100)), 0)
 
-		glutSwapBuffers(1)
+		with self._profiler.span("swap"):
+			glutSwapBuffers(1)
 
 	def _gl_keyboard(self, key, pos_x, pos_y):
 		if key == b"\x1b":
 			sys.exit(0)
+		elif key == b"p":
+			if self._glasscockpit.profiler is not None:
+				self._glasscockpit.profiler.dump()
+			self._profiler.summary()
 
 	@classmethod
-	def run(cls, glasscockpit, frametime_millis, data_callback = None, fullscreen = False):
-		app = cls(glasscockpit, data_callback = data_callback, fullscreen = fullscreen)
+	def run(cls, glasscockpit, frametime_millis, data_callback = None, fullscreen = False, swap_interval = None, render_on_change = True, partial_redraw = False, profiler = None, telemetry = None):
+		app = cls(glasscockpit, frametime_millis, data_callback = data_callback, fullscreen = fullscreen, swap_interval = swap_interval, render_on_change = render_on_change, partial_redraw = partial_redraw, profiler = profiler, telemetry = telemetry)
 		glutMainLoop()
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+import sys
+import array
+import struct
+
+class DecodeException(ValueError):
+	pass
+
+# Fixed-layout binary encoding of the complete instrument data. A datagram is
+# an 8 byte header (magic, version, field count, sequence number) followed by
+# one little endian double per entry of FIELDS, in that order. Because the
+# body has the same layout as an array("d") on little endian machines,
+# decode_into() is a single copy into a preallocated array without creating
+# any Python objects. Fields may only ever be appended; changing or
+# reordering them requires a new VERSION.
+class InstrumentCodec(object):
+	MAGIC = b"GC"
+	VERSION = 1
+	FIELDS = (
+		("pos", "heading_deg"),
+		("pos", "altitude_ft"),
+		("pos", "pitch_angle_deg"),
+		("pos", "roll_angle_deg"),
+		("pos", "tas"),
+		("pos", "ias"),
+		("ap", "hdgbug_deg"),
+		("vor1", "obs"),
+		("vor1", "deviation_deg"),
+		("freq", "com1", "active"),
+		("freq", "com1", "stby"),
+		("freq", "com2", "active"),
+		("freq", "com2", "stby"),
+		("freq", "nav1", "active"),
+		("freq", "nav1", "stby"),
+		("freq", "nav2", "active"),
+		("freq", "nav2", "stby"),
+		("xpdr", "squawk"),
+		("ias_bars", "white", 0),
+		("ias_bars", "white", 1),
+		("ias_bars", "red", 0),
+		("ias_bars", "red", 1),
+		("ias_bars", "green", 0),
+		("ias_bars", "green", 1),
+		("ias_bars", "yellow", 0),
+		("ias_bars", "yellow", 1),
+		("ias_bars", "redwhite", 0),
+		("ias_bars", "redwhite", 1),
+	)
+	INDEX = { path: index for (index, path) in enumerate(FIELDS) }
+	_HEADER = struct.Struct("<2sBBI")
+	_BODY = struct.Struct("<%dd" % (len(FIELDS)))
+	PACKET_SIZE = _HEADER.size + _BODY.size
+	_NATIVE_LITTLE_ENDIAN = (sys.byteorder == "little")
+
+	@staticmethod
+	def _lookup(data, path):
+		for key in path:
+			data = data[key]
+		return data
+
+	@classmethod
+	def create_values(cls):
+		return array.array("d", bytes(cls._BODY.size))
+
+	@classmethod
+	def encode_into(cls, buffer, data, sequence = 0, offset = 0):
+		cls._HEADER.pack_into(buffer, offset, cls.MAGIC, cls.VERSION, len(cls.FIELDS), sequence & 0xffffffff)
+		cls._BODY.pack_into(buffer, offset + cls._HEADER.size, *(cls._lookup(data, path) for path in cls.FIELDS))
+
+	@classmethod
+	def encode(cls, data, sequence = 0):
+		buffer = bytearray(cls.PACKET_SIZE)
+		cls.encode_into(buffer, data, sequence)
+		return bytes(buffer)
+
+	@classmethod
+	def _check_header(cls, packet):
+		if len(packet) < cls.PACKET_SIZE:
+			raise DecodeException("Packet too short, %d bytes instead of %d." % (len(packet), cls.PACKET_SIZE))
+		(magic, version, field_count, sequence) = cls._HEADER.unpack_from(packet)
+		if magic != cls.MAGIC:
+			raise DecodeException("Invalid magic %s." % (str(magic)))
+		if version != cls.VERSION:
+			raise DecodeException("Unsupported version %d, expected %d." % (version, cls.VERSION))
+		if field_count != len(cls.FIELDS):
+			raise DecodeException("Packet has %d fields, expected %d." % (field_count, len(cls.FIELDS)))
+		return sequence
+
+	@classmethod
+	def decode_into(cls, packet, values):
+		# Copies all field values into values, an array as returned by
+		# create_values(), and returns the sequence number.
+		sequence = cls._check_header(packet)
+		body = memoryview(packet)[cls._HEADER.size : cls.PACKET_SIZE]
+		memoryview(values).cast("B")[:] = body
+		if not cls._NATIVE_LITTLE_ENDIAN:
+			values.byteswap()
+		return sequence
+
+	@classmethod
+	def bind(cls, data):
+		# Resolves every field of nested instrument data to the dict or list
+		# that holds it, creating the ones that are missing. The bindings can
+		# be reused for as long as the containers are not replaced.
+		bindings = [ ]
+		for path in cls.FIELDS:
+			target = data
+			for (key, next_key) in zip(path, path[1:]):
+				if isinstance(target, dict) and (key not in target):
+					target[key] = [ 0, 0 ] if isinstance(next_key, int) else { }
+				target = target[key]
+			bindings.append((target, path[-1]))
+		return bindings
+
+	@classmethod
+	def values_to_data(cls, values, data = None, bindings = None):
+		if data is None:
+			data = { }
+		if bindings is None:
+			bindings = cls.bind(data)
+		for ((container, key), value) in zip(bindings, values):
+			container[key] = value
+		xpdr = data["xpdr"]
+		xpdr["squawk"] = int(xpdr["squawk"])
+		return data
+
+	@classmethod
+	def decode(cls, packet):
+		# Returns the complete nested instrument data including the "seq"
+		# sequence number, in the same form as a JSON datagram.
+		sequence = cls._check_header(packet)
+		data = cls.values_to_data(cls._BODY.unpack_from(packet, cls._HEADER.size))
+		data["seq"] = sequence
+		return data
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+import time
+from StopWatch import StopWatch
+from cwrap.OffscreenOpenGLContext import OffscreenOpenGLContext
+import cwrap
+
+class OffscreenApplication(object):
+	def __init__(self, glasscockpit, data_callback = None):
+		self._glasscockpit = glasscockpit
+		self._data_callback = data_callback
+		preload = cwrap.OpenGLContext.preload()
+		with StopWatch("Offscreen OpenGL initialization", noisy = True):
+			self._screen_ctx = OffscreenOpenGLContext(glasscockpit.screen_dimension)
+		with StopWatch("Texture preloading", noisy = True):
+			self._screen_ctx.upload_preloaded(preload)
+		self._frametimes = [ ]
+		self._gl_calls = [ ]
+
+	@property
+	def screen_ctx(self):
+		return self._screen_ctx
+
+	@property
+	def frametimes(self):
+		return self._frametimes
+
+	@property
+	def gl_calls(self):
+		return self._gl_calls
+
+	def render_frame(self):
+		if self._data_callback is not None:
+			self._data_callback()
+		t0 = time.time()
+		self._screen_ctx.begin_frame()
+		self._glasscockpit.render_opengl(self._screen_ctx)
+		gl_calls = self._screen_ctx.end_frame()
+		self._screen_ctx.finish()
+		t1 = time.time()
+		self._frametimes.append(t1 - t0)
+		self._gl_calls.append(gl_calls.calls)
+
+	def print_summary(self):
+		if len(self._frametimes) == 0:
+			return
+		frametimes = sorted(self._frametimes)
+		average = sum(frametimes) / len(frametimes)
+		median = frametimes[len(frametimes) // 2]
+		print("%d frames: average %.1f ms = %.1f fps, median %.1f ms, min %.1f ms, max %.1f ms, %.0f GL calls per frame" % (len(frametimes), average * 1000, 1 / average, median * 1000, frametimes[0] * 1000, frametimes[-1] * 1000, sum(self._gl_calls) / len(self._gl_calls)))
+
+	@classmethod
+	def run(cls, glasscockpit, frame_count, data_callback = None, png_filename = None):
+		app = cls(glasscockpit, data_callback = data_callback)
+		for frame in range(frame_count):
+			app.render_frame()
+		app.print_summary()
+		if png_filename is not None:
+			app.screen_ctx.write_to_png(png_filename)
+		app.screen_ctx.destroy()
+		return app
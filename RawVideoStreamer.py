@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+import os
+import sys
+import time
+import cwrap
+
+# Renders frames on a fixed timestep and writes the raw pixel data of the
+# Cairo surface (ARGB32 in native byte order, i.e. BGRA on little endian
+# machines) to a file descriptor, e.g. stdout or a named pipe read by a video
+# encoder. Diagnostics go to stderr so they do not end up in the stream.
+class RawVideoStreamer(object):
+	def __init__(self, glasscockpit, output, fps, data_callback = None, sprite_cache = None, realtime = True, telemetry = None):
+		self._glasscockpit = glasscockpit
+		self._telemetry = telemetry
+		self._frametime = 1 / fps
+		self._data_callback = data_callback
+		self._realtime = realtime
+		self._screen = cwrap.CairoContext.create(glasscockpit.screen_dimension, sprite_cache = sprite_cache)
+		if output == "-":
+			self._output = os.fdopen(sys.__stdout__.fileno(), "wb", buffering = 0, closefd = False)
+		else:
+			self._output = open(output, "wb", buffering = 0)
+		self._frame_count = 0
+		self._late_frames = 0
+		self._max_lag = 0
+		self._render_time = 0
+
+	def _log(self, msg):
+		print(msg, file = sys.stderr)
+
+	def _write_frame(self):
+		# Unbuffered writes straight from the surface memory; pipes may
+		# accept less than a whole frame at once.
+		self._screen.surface.flush()
+		data = memoryview(self._screen.surface.get_data()).cast("B")
+		while len(data) > 0:
+			written = self._output.write(data)
+			data = data[written:]
+
+	def render_frame(self):
+		if self._data_callback is not None:
+			self._data_callback()
+		t0 = time.time()
+		self._screen.clear()
+		self._glasscockpit.render(self._screen)
+		render_time = time.time() - t0
+		self._render_time += render_time
+		if self._telemetry is not None:
+			self._telemetry.record(render_time)
+			self._telemetry.update_overlay()
+			self._telemetry.draw_overlay(self._screen)
+		self._write_frame()
+		self._frame_count += 1
+
+	def _print_stats(self, t_start):
+		tdiff = time.time() - t_start
+		self._log("%d frames, %.1f fps output, %.1f ms average render time, %d frames late, max lag %.0f ms" % (self._frame_count, self._frame_count / tdiff, self._render_time / self._frame_count * 1000, self._late_frames, self._max_lag * 1000))
+
+	def run(self, frame_count = None):
+		dimension = self._glasscockpit.screen_dimension
+		stride = self._screen.surface.get_stride()
+		self._log("Streaming %dx%d frames (stride %d bytes, ARGB32 in native byte order) at %.2f fps" % (dimension.x, dimension.y, stride, 1 / self._frametime))
+		self._log("E.g.: ffmpeg -f rawvideo -pixel_format bgra -video_size %dx%d -framerate %.2f -i - output.mp4" % (stride // 4, dimension.y, 1 / self._frametime))
+
+		t_start = time.time()
+		t_stats = t_start
+		try:
+			while (frame_count is None) or (self._frame_count < frame_count):
+				deadline = t_start + (self._frame_count * self._frametime)
+				now = time.time()
+				if now < deadline:
+					if self._realtime:
+						time.sleep(deadline - now)
+				elif now - deadline > self._frametime:
+					# Frames are never dropped from the stream, falling behind
+					# only delays them.
+					self._late_frames += 1
+					self._max_lag = max(self._max_lag, now - deadline)
+				self.render_frame()
+				if time.time() - t_stats >= 1:
+					self._print_stats(t_start)
+					t_stats = time.time()
+		except (BrokenPipeError, KeyboardInterrupt):
+			pass
+		finally:
+			self._output.close()
+		if self._frame_count > 0:
+			self._print_stats(t_start)
+			if self._late_frames == 0:
+				self._log("Kept up with real time.")
+			else:
+				self._log("Did not keep up with real time: %d of %d frames were late." % (self._late_frames, self._frame_count))
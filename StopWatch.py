@@ -23,12 +23,20 @@
 #
 #	File UUID 25454b15-67f7-4287-afbd-d6168a30cc9f
 
+import os
+import sys
+import json
+import math
 import time
+import threading
+import collections
 
 class StopWatch(object):
-	def __init__(self, component = None, noisy = False):
+	def __init__(self, component = None, noisy = False, profiler = None):
 		self._component = component
 		self._noisy = noisy
+		self._profiler = profiler
+		self._path = None
 		self.reset()
 
 	@property
@@ -36,17 +44,21 @@ class StopWatch(object):
 		return self._finishtime
 
 	def stop(self):
-		self._finishtime = time.time() - self._t
+		self._finishtime = (time.perf_counter_ns() - self._t) / 1e9
 		return self.finishtime
 
 	def finish(self):
-		self._finishtime = self.stop()
+		elapsed_ns = time.perf_counter_ns() - self._t
+		self._finishtime = elapsed_ns / 1e9
+		if self._path is not None:
+			self._profiler.span_finished(self._path, self._t, elapsed_ns)
+			self._path = None
 		if self._noisy:
 			print("%s took %s" % (self._component, str(self)))
 
 	def reset(self):
 		self._finishtime = None
-		self._t = time.time()
+		self._t = time.perf_counter_ns()
 
 	def __str__(self):
 		t = self.stop()
@@ -66,11 +78,144 @@ class StopWatch(object):
 				return "%d-%d:%02d:%02d d-h:m:s" % (tint // 86400, tint % 86400 // 3600, tint % 86400 % 3600 // 60, tint % 86400 % 3600 % 60)
 
 	def __enter__(self):
+		if self._profiler is not None:
+			self._path = self._profiler.span_started(self._component)
 		self.reset()
+		return self
 
 	def __exit__(self, type, value, traceback):
 		self.finish()
 
+class SpanStatistics(object):
+	# Durations are counted in logarithmic buckets (four per power of two),
+	# so percentiles are accurate to about 19% with constant memory.
+	_BUCKETS_PER_OCTAVE = 4
+
+	def __init__(self):
+		self._count = 0
+		self._total_ns = 0
+		self._min_ns = None
+		self._max_ns = 0
+		self._buckets = collections.Counter()
+
+	@property
+	def count(self):
+		return self._count
+
+	@property
+	def total(self):
+		return self._total_ns / 1e9
+
+	@property
+	def mean(self):
+		return (self._total_ns / self._count / 1e9) if (self._count > 0) else 0
+
+	@property
+	def min(self):
+		return (self._min_ns or 0) / 1e9
+
+	@property
+	def max(self):
+		return self._max_ns / 1e9
+
+	def add(self, duration_ns):
+		self._count += 1
+		self._total_ns += duration_ns
+		if (self._min_ns is None) or (duration_ns < self._min_ns):
+			self._min_ns = duration_ns
+		if duration_ns > self._max_ns:
+			self._max_ns = duration_ns
+		self._buckets[int(math.log2(duration_ns + 1) * self._BUCKETS_PER_OCTAVE)] += 1
+
+	def percentile(self, p):
+		# Upper bound of the bucket the p-th percentile falls into
+		if self._count == 0:
+			return 0
+		rank = math.ceil(p / 100 * self._count)
+		seen = 0
+		for bucket in sorted(self._buckets):
+			seen += self._buckets[bucket]
+			if seen >= rank:
+				return min(2 ** ((bucket + 1) / self._BUCKETS_PER_OCTAVE), self._max_ns) / 1e9
+		return self.max
+
+class Profiler(object):
+	# Named spans that nest per thread ("frame/render"). Every span path is
+	# aggregated into a histogram; optionally the most recent spans are
+	# kept as trace events that can be written in Chrome's trace format
+	# (chrome://tracing or Perfetto).
+	def __init__(self, trace_events = 0, enabled = True):
+		self._enabled = enabled
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self._stats = { }
+		self._trace = collections.deque(maxlen = trace_events) if (trace_events > 0) else None
+		self._t0 = time.perf_counter_ns()
+
+	@property
+	def enabled(self):
+		return self._enabled
+
+	def span(self, name):
+		return StopWatch(name, profiler = self if self._enabled else None)
+
+	def span_started(self, name):
+		stack = getattr(self._local, "stack", None)
+		if stack is None:
+			stack = [ ]
+			self._local.stack = stack
+		path = name if (len(stack) == 0) else (stack[-1] + "/" + name)
+		stack.append(path)
+		return path
+
+	def span_finished(self, path, t_start_ns, duration_ns):
+		self._local.stack.pop()
+		with self._lock:
+			stats = self._stats.get(path)
+			if stats is None:
+				stats = SpanStatistics()
+				self._stats[path] = stats
+			stats.add(duration_ns)
+			if self._trace is not None:
+				self._trace.append((path, threading.get_ident(), t_start_ns, duration_ns))
+
+	def stats(self, path):
+		with self._lock:
+			return self._stats.get(path)
+
+	def reset(self):
+		with self._lock:
+			self._stats = { }
+			if self._trace is not None:
+				self._trace.clear()
+
+	def summary(self, f = None):
+		if f is None:
+			f = sys.stdout
+		with self._lock:
+			items = sorted(self._stats.items())
+		print("%-40s %8s %9s %9s %9s %9s" % ("Span", "count", "mean ms", "p50 ms", "p95 ms", "p99 ms"), file = f)
+		for (path, stats) in items:
+			print("%-40s %8d %9.3f %9.3f %9.3f %9.3f" % (path, stats.count, stats.mean * 1000, stats.percentile(50) * 1000, stats.percentile(95) * 1000, stats.percentile(99) * 1000), file = f)
+
+	def write_chrome_trace(self, filename):
+		pid = os.getpid()
+		with self._lock:
+			spans = list(self._trace or [ ])
+		events = [ ]
+		for (path, tid, t_start_ns, duration_ns) in spans:
+			events.append({
+				"name":	path.rsplit("/", 1)[-1],
+				"cat":	path,
+				"ph":	"X",
+				"ts":	(t_start_ns - self._t0) / 1000,
+				"dur":	duration_ns / 1000,
+				"pid":	pid,
+				"tid":	tid,
+			})
+		with open(filename, "w") as f:
+			json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, f)
+
 if __name__ == "__main__":
 	x = StopWatch("foobar", True)
 	time.sleep(0.1)
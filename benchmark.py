@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+#
+#	Renders scripted instrument trajectories with both backends and writes
+#	frame time statistics to a JSON file so that commits can be compared.
+#
+
+import os
+import sys
+import json
+import math
+import time
+import platform
+import tracemalloc
+import subprocess
+import geo
+from FriendlyArgumentParser import FriendlyArgumentParser
+
+def base_data():
+	return {
+		"pos": {
+			"heading_deg":		128,
+			"altitude_ft":		12345,
+			"pitch_angle_deg":	2,
+			"roll_angle_deg":	0,
+			"tas":				123,
+			"ias":				120,
+		},
+		"ap": {
+			"hdgbug_deg":		130,
+		},
+		"vor1": {
+			"obs":				72,
+			"deviation_deg":	0.5,
+		},
+		"freq": {
+			"com1":	{ "active": 118.000, "stby": 119.400 },
+			"com2":	{ "active": 120.125, "stby": 121.500 },
+			"nav1":	{ "active": 110.40, "stby": 111.20 },
+			"nav2":	{ "active": 113.25, "stby": 112.95 },
+		},
+		"xpdr": {
+			"squawk":			7000,
+		},
+		"ias_bars": {
+			"white":			[0, 100],
+			"red":				[0, 60],
+			"green":			[60, 150],
+			"yellow":			[150, 220],
+			"redwhite":			[220, 9999],
+		},
+		"clock": {
+			"utc":				"12:00:00",
+		},
+	}
+
+# Trajectories map a frame number to complete instrument data; they only
+# depend on the frame number so every run renders exactly the same frames.
+def trajectory_cruise(frame):
+	data = base_data()
+	data["pos"]["heading_deg"] = (128 + 0.01 * frame) % 360
+	data["pos"]["pitch_angle_deg"] = 2 + 0.2 * math.sin(frame / 50)
+	data["pos"]["roll_angle_deg"] = 0.5 * math.sin(frame / 70)
+	data["pos"]["ias"] = 120 + 0.5 * math.sin(frame / 40)
+	data["clock"]["utc"] = "12:%02d:%02d" % (frame // 3600 % 60, frame // 60 % 60)
+	return data
+
+def trajectory_manoeuvres(frame):
+	data = base_data()
+	data["pos"]["heading_deg"] = (128 + 3 * frame) % 360
+	data["pos"]["pitch_angle_deg"] = 15 * math.sin(frame / 15)
+	data["pos"]["roll_angle_deg"] = 60 * math.sin(frame / 20)
+	data["pos"]["ias"] = 110 + 30 * math.sin(frame / 25)
+	data["ap"]["hdgbug_deg"] = (130 - 2 * frame) % 360
+	data["vor1"]["obs"] = (72 + 1.5 * frame) % 360
+	data["vor1"]["deviation_deg"] = 5 * math.sin(frame / 10)
+	return data
+
+def trajectory_frequencies(frame):
+	data = base_data()
+	for (index, radio) in enumerate([ "com1", "com2" ]):
+		data["freq"][radio]["active"] = 118 + ((frame + 7 * index) % 760) * 0.025
+		data["freq"][radio]["stby"] = 118 + ((frame * 3 + 11 * index) % 760) * 0.025
+	for (index, radio) in enumerate([ "nav1", "nav2" ]):
+		data["freq"][radio]["active"] = 108 + ((frame + 5 * index) % 200) * 0.05
+		data["freq"][radio]["stby"] = 108 + ((frame * 3 + 13 * index) % 200) * 0.05
+	data["xpdr"]["squawk"] = int("%o" % (frame % 4096))
+	data["clock"]["utc"] = "12:%02d:%02d" % (frame // 60 % 60, frame % 60)
+	return data
+
+def trajectory_ias_sweep(frame):
+	# Triangle wave from 0 to 250 kt and back, crossing all IAS bar limits
+	data = base_data()
+	phase = (frame * 0.7) % 500
+	data["pos"]["ias"] = phase if (phase < 250) else (500 - phase)
+	return data
+
+trajectories = {
+	"cruise":		trajectory_cruise,
+	"manoeuvres":	trajectory_manoeuvres,
+	"frequencies":	trajectory_frequencies,
+	"ias_sweep":	trajectory_ias_sweep,
+}
+
+parser = FriendlyArgumentParser()
+parser.add_argument("-b", "--backend", choices = [ "cairo", "gl", "all" ], default = "all", help = "Backend to benchmark; the OpenGL backend renders headless using OSMesa. Defaults to %(default)s.")
+parser.add_argument("-t", "--trajectory", choices = sorted(trajectories.keys()), action = "append", help = "Trajectory to render. Can be given multiple times, defaults to all of them.")
+parser.add_argument("-r", "--resolution", metavar = "height", type = int, default = 720, help = "Resolution to render at; defaults to %(default)d.")
+parser.add_argument("-n", "--frames", metavar = "count", type = int, default = 500, help = "Number of measured frames per trajectory. Defaults to %(default)d.")
+parser.add_argument("-w", "--warmup", metavar = "count", type = int, default = 20, help = "Number of frames rendered before measuring starts. Defaults to %(default)d.")
+parser.add_argument("-a", "--alloc-frames", metavar = "count", type = int, default = 50, help = "Number of frames that are rendered again with allocation tracing enabled. Defaults to %(default)d.")
+parser.add_argument("-o", "--output", metavar = "filename", default = "benchmark.json", help = "JSON file the results are written to. Defaults to %(default)s.")
+args = parser.parse_args(sys.argv[1:])
+
+backends = [ "cairo", "gl" ] if (args.backend == "all") else [ args.backend ]
+if "gl" in backends:
+	# Needs to be set before anything imports PyOpenGL
+	os.environ["PYOPENGL_PLATFORM"] = "osmesa"
+
+import cwrap
+import gcwidget
+
+config = {
+	"screen_dimension":	geo.Vector2d(args.resolution * 16 // 9, args.resolution),
+}
+
+class CairoBenchmark(object):
+	def __init__(self):
+		self._glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext)
+		self._screen = cwrap.CairoContext.create(config["screen_dimension"])
+
+	def render_frame(self, data):
+		self._glasscockpit.feed_data(data)
+		t0 = time.perf_counter()
+		self._screen.clear()
+		self._glasscockpit.render(self._screen)
+		self._screen.surface.flush()
+		return (time.perf_counter() - t0, None)
+
+	def destroy(self):
+		pass
+
+class OpenGLBenchmark(object):
+	def __init__(self):
+		from OffscreenApplication import OffscreenApplication
+		self._glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.OpenGLContext, img_prefix = "tex_")
+		self._app = OffscreenApplication(self._glasscockpit)
+
+	def render_frame(self, data):
+		self._glasscockpit.feed_data(data)
+		self._app.render_frame()
+		return (self._app.frametimes[-1], self._app.gl_calls[-1])
+
+	def destroy(self):
+		self._app.screen_ctx.destroy()
+
+def percentile(sorted_values, p):
+	index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+	return sorted_values[index]
+
+def run_benchmark(backend, trajectory_name):
+	trajectory = trajectories[trajectory_name]
+	benchmark = CairoBenchmark() if (backend == "cairo") else OpenGLBenchmark()
+	for frame in range(args.warmup):
+		benchmark.render_frame(trajectory(frame))
+
+	frametimes = [ ]
+	gl_calls = [ ]
+	for frame in range(args.warmup, args.warmup + args.frames):
+		(frametime, calls) = benchmark.render_frame(trajectory(frame))
+		frametimes.append(frametime)
+		if calls is not None:
+			gl_calls.append(calls)
+
+	# Allocation tracing slows rendering down considerably, so it is done
+	# in a separate pass over the same frames.
+	alloc_peaks = [ ]
+	alloc_retained = [ ]
+	tracemalloc.start()
+	for frame in range(args.warmup, args.warmup + args.alloc_frames):
+		data = trajectory(frame)
+		(before, peak) = tracemalloc.get_traced_memory()
+		tracemalloc.reset_peak()
+		benchmark.render_frame(data)
+		(after, peak) = tracemalloc.get_traced_memory()
+		alloc_peaks.append(peak - before)
+		alloc_retained.append(after - before)
+	tracemalloc.stop()
+	benchmark.destroy()
+
+	frametimes.sort()
+	result = {
+		"backend":		backend,
+		"trajectory":	trajectory_name,
+		"frames":		len(frametimes),
+		"frametime_ms": {
+			"mean":		sum(frametimes) / len(frametimes) * 1000,
+			"p50":		percentile(frametimes, 50) * 1000,
+			"p95":		percentile(frametimes, 95) * 1000,
+			"p99":		percentile(frametimes, 99) * 1000,
+			"max":		frametimes[-1] * 1000,
+		},
+		"alloc_per_frame_bytes": {
+			"peak":		sum(alloc_peaks) / len(alloc_peaks) if (len(alloc_peaks) > 0) else None,
+			"retained":	sum(alloc_retained) / len(alloc_retained) if (len(alloc_retained) > 0) else None,
+		},
+		"gl_calls_per_frame":	(sum(gl_calls) / len(gl_calls)) if (len(gl_calls) > 0) else None,
+	}
+	return result
+
+def git_revision():
+	try:
+		return subprocess.check_output([ "git", "rev-parse", "HEAD" ], stderr = subprocess.DEVNULL).decode("ascii").strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+results = [ ]
+for backend in backends:
+	for trajectory_name in (args.trajectory or sorted(trajectories.keys())):
+		result = run_benchmark(backend, trajectory_name)
+		frametime = result["frametime_ms"]
+		gl_calls = "" if (result["gl_calls_per_frame"] is None) else (", %.0f GL calls" % (result["gl_calls_per_frame"]))
+		print("%-6s %-12s p50 %6.2f ms  p95 %6.2f ms  p99 %6.2f ms, %.0f kiB peak allocation per frame%s" % (backend, trajectory_name, frametime["p50"], frametime["p95"], frametime["p99"], result["alloc_per_frame_bytes"]["peak"] / 1024 if (result["alloc_per_frame_bytes"]["peak"] is not None) else 0, gl_calls))
+		results.append(result)
+
+report = {
+	"revision":		git_revision(),
+	"timestamp":	time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+	"python":		platform.python_version(),
+	"machine":		platform.machine(),
+	"resolution":	[ config["screen_dimension"].x, config["screen_dimension"].y ],
+	"warmup":		args.warmup,
+	"results":		results,
+}
+with open(args.output, "w") as f:
+	json.dump(report, f, indent = 4)
+print("Results written to %s" % (args.output))
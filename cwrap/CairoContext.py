@@ -1,15 +1,29 @@
+import math
 import cairo
 import collections
 from geo import Vector2d
+from .CairoTextCache import CairoTextCache
+from .TextMetrics import TextMetrics, TextExtents
 
 FontExtents = collections.namedtuple("FontExtents", [ "ascent", "descent", "height", "max_x_advance", "max_y_advance" ])
-TextExtents = collections.namedtuple("TextExtents", [ "x_bearing", "y_bearing", "width", "height", "x_advance", "y_advance" ])
+CairoRenderTarget = collections.namedtuple("CairoRenderTarget", [ "origin", "source" ])
 
 class CairoContext(object):
-	def __init__(self, dimensions, surface, cairoctx):
+	_default_text_cache = None
+
+	def __init__(self, dimensions, surface, cairoctx, sprite_cache = None, text_cache = None):
 		self._dimensions = dimensions
 		self._surface = surface
 		self._cairoctx = cairoctx
+		self._sprite_cache = sprite_cache
+		if text_cache is None:
+			# Contexts are short-lived (one per frame when wrapping), so fonts
+			# and extents are shared between all of them by default.
+			if CairoContext._default_text_cache is None:
+				CairoContext._default_text_cache = CairoTextCache()
+			text_cache = CairoContext._default_text_cache
+		self._text_cache = text_cache
+		self._font = None
 		self._font_extents = None
 
 	@property
@@ -20,15 +34,30 @@ class CairoContext(object):
 	def surface(self):
 		return self._surface
 
+	@property
+	def text_cache(self):
+		return self._text_cache
+
+	@property
+	def font_extents(self):
+		if (self._font_extents is None) and (self._font is not None):
+			(fontname, fontsize, fontcolor) = self._font
+			self._font_extents = FontExtents(*self._text_cache.font_extents(fontname, fontsize))
+		return self._font_extents
+
+	@classmethod
+	def set_default_text_cache(cls, text_cache):
+		CairoContext._default_text_cache = text_cache
+
 	@classmethod
-	def wrap(cls, dimensions, cairoctx):
-		return cls(dimensions = dimensions, surface = None, cairoctx = cairoctx)
+	def wrap(cls, dimensions, cairoctx, sprite_cache = None, text_cache = None):
+		return cls(dimensions = dimensions, surface = None, cairoctx = cairoctx, sprite_cache = sprite_cache, text_cache = text_cache)
 
 	@classmethod
-	def create(cls, dimensions):
+	def create(cls, dimensions, sprite_cache = None, text_cache = None):
 		surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, dimensions.x, dimensions.y)
 		cairoctx = cairo.Context(surface)
-		return cls(dimensions = dimensions, surface = surface, cairoctx = cairoctx)
+		return cls(dimensions = dimensions, surface = surface, cairoctx = cairoctx, sprite_cache = sprite_cache, text_cache = text_cache)
 
 	@classmethod
 	def load_from_png(cls, png_filename, dimension):
@@ -37,12 +66,73 @@ class CairoContext(object):
 		dimensions = Vector2d(surface.get_width(), surface.get_height())
 		return cls(dimensions = dimensions, surface = surface, cairoctx = cairoctx)
 
+	@classmethod
+	def flatten_layers(cls, dimensions, layers):
+		# Layers are (source, offset, clip) tuples in the coordinates of the
+		# flattened image.
+		flattened = cls.create(dimensions)
+		for (source, offset, clip) in layers:
+			flattened.blit(source, offset = offset, clip = clip)
+		flattened.surface.flush()
+		return flattened
+
+	def create_render_target(self, box):
+		return CairoRenderTarget(origin = box.base, source = self.create(Vector2d(round(box.dimensions.x), round(box.dimensions.y)), sprite_cache = self._sprite_cache, text_cache = self._text_cache))
+
+	def begin_render_target(self, target):
+		# Returns the context to draw the target's content with; it accepts
+		# the same screen coordinates as this one.
+		cairoctx = target.source._cairoctx
+		cairoctx.identity_matrix()
+		cairoctx.reset_clip()
+		cairoctx.save()
+		cairoctx.set_operator(cairo.OPERATOR_CLEAR)
+		cairoctx.paint()
+		cairoctx.restore()
+		cairoctx.translate(-target.origin.x, -target.origin.y)
+		return target.source
+
+	def end_render_target(self, target):
+		target.source.surface.flush()
+
+	def delete_render_target(self, target):
+		pass
+
+	def clear(self):
+		self._cairoctx.save()
+		self._cairoctx.set_operator(cairo.OPERATOR_CLEAR)
+		self._cairoctx.paint()
+		self._cairoctx.restore()
+
 	def write_to_png(self, filename):
 		self._surface.write_to_png(filename)
 
+	def _blit_sprite(self, source, offset, clip, rotation_rad, center_of_rotation):
+		# Rotating the source around the center of rotation equals rotating
+		# it around its own origin and moving it to where that origin ends
+		# up. The sprite is placed on whole pixels, so Cairo copies it
+		# without any filtering.
+		sprite = self._sprite_cache.lookup(source, rotation_rad)
+		(cos, sin) = (math.cos(sprite.rotation_rad), math.sin(sprite.rotation_rad))
+		(dx, dy) = (offset.x - center_of_rotation.x, offset.y - center_of_rotation.y)
+		x = round(center_of_rotation.x + (cos * dx) - (sin * dy) + sprite.origin.x)
+		y = round(center_of_rotation.y + (sin * dx) + (cos * dy) + sprite.origin.y)
+
+		self._cairoctx.save()
+		if clip is not None:
+			self._cairoctx.rectangle(clip.base.x, clip.base.y, clip.dimensions.x, clip.dimensions.y)
+			self._cairoctx.clip()
+		self._cairoctx.set_source_surface(sprite.surface, x, y)
+		self._cairoctx.rectangle(x, y, sprite.surface.get_width(), sprite.surface.get_height())
+		self._cairoctx.fill()
+		self._cairoctx.restore()
+
 	def blit(self, source, offset = None, clip = None, rotation_rad = None, center_of_rotation = None, clipped_callback = None):
 		if offset is None:
 			offset = Vector2d(0, 0)
+		if (rotation_rad is not None) and (self._sprite_cache is not None) and (clipped_callback is None):
+			assert(center_of_rotation is not None)
+			return self._blit_sprite(source, offset, clip, rotation_rad, center_of_rotation)
 		self._cairoctx.save()
 		if clip is not None:
 			self._cairoctx.rectangle(clip.base.x, clip.base.y, clip.dimensions.x, clip.dimensions.y)
@@ -68,42 +158,32 @@ class CairoContext(object):
 		else:
 			# Black by default
 			self._cairoctx.set_source_rgb(0, 0, 0)
-		self._cairoctx.select_font_face(fontname, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-		self._cairoctx.set_font_size(fontsize)
-		self._font_extents = FontExtents(*self._cairoctx.font_extents())
+		self._cairoctx.set_scaled_font(self._text_cache.scaled_font(fontname, fontsize))
+		self._font = (fontname, fontsize, fontcolor)
+		self._font_extents = None
 
 	def text(self, pos, text, anchor = "tl"):
-		# Anchor is one of top/center/bottom - left/center/right combinations
-		assert(len(anchor) == 2)
-		(valign, halign) = anchor
-		assert(valign in "tcb")
-		assert(halign in "lcr")
-
-		text_extents = TextExtents(*self._cairoctx.text_extents(text))
-		if valign == "b":
-			# Baseline, Cairo default
-			pass
-		elif valign == "t":
-			# Top left
-			pos -= Vector2d(0, text_extents.y_bearing)
-		elif valign == "c":
-			# Center left
-			pos -= Vector2d(0, text_extents.y_bearing / 2)
+		if self._font is None:
+			# No font selected, measure and draw with the context's current one
+			text_extents = TextExtents(*self._cairoctx.text_extents(text))
 		else:
-			raise Exception(NotImplemented)
-		if halign == "l":
-			# Left-aligned, Cairo default
-			pass
-		elif halign == "r":
-			# Right-alighed
-			pos -= Vector2d(text_extents.x_advance, 0)
-		elif valign == "c":
-			# Center alignment
-			pos -= Vector2d(text_extents.x_advance / 2, 0)
+			(fontname, fontsize, fontcolor) = self._font
+			text_extents = TextExtents(*self._text_cache.text_extents(fontname, fontsize, text))
+		pos = TextMetrics.anchor_position(pos, text_extents, anchor)
+
+		if (self._font is not None) and self._text_cache.caches_surfaces:
+			# Pre-rendered text is placed on whole pixels so it is copied
+			# without filtering.
+			sprite = self._text_cache.text_surface(fontname, fontsize, fontcolor, text)
+			(x, y) = (round(pos.x) + sprite.origin.x, round(pos.y) + sprite.origin.y)
+			self._cairoctx.save()
+			self._cairoctx.set_source_surface(sprite.surface, x, y)
+			self._cairoctx.rectangle(x, y, sprite.surface.get_width(), sprite.surface.get_height())
+			self._cairoctx.fill()
+			self._cairoctx.restore()
 		else:
-			raise Exception(NotImplemented)
-		self._cairoctx.move_to(pos.x, pos.y)
-		self._cairoctx.show_text(text)
+			self._cairoctx.move_to(pos.x, pos.y)
+			self._cairoctx.show_text(text)
 
 	def __str__(self):
 		return "CairoContext<%s>" % (self._dimensions)
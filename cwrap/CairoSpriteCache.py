@@ -0,0 +1,110 @@
+import math
+import queue
+import cairo
+import threading
+import collections
+from geo import Vector2d
+from .ObjectLRUCache import ObjectLRUCache
+
+Sprite = collections.namedtuple("Sprite", [ "surface", "origin", "rotation_rad" ])
+
+# Pre-rotated copies of layer surfaces for the Cairo backend. Angles are
+# quantized to a fixed step so that a rotating layer can be drawn as a plain,
+# unfiltered copy of a cached sprite instead of being resampled every frame.
+# A background thread renders the angles next to the ones that were used.
+class CairoSpriteCache(object):
+	def __init__(self, step_deg = 0.5, max_bytes = 128 * 1024 * 1024, prefill_count = 2):
+		self._step_rad = step_deg / 180 * math.pi
+		self._prefill_count = prefill_count
+		self._cache = ObjectLRUCache(self._render, size_callback = self._sprite_size, max_bytes = max_bytes)
+		self._lock = threading.Lock()
+		self._rendered = threading.Condition(self._lock)
+		self._rendering = set()
+		self._queue = queue.Queue()
+		self._queued = set()
+		self._thread = None
+		if prefill_count > 0:
+			self._thread = threading.Thread(target = self._prefill_worker, daemon = True)
+			self._thread.start()
+
+	@property
+	def stats(self):
+		with self._lock:
+			return self._cache.stats
+
+	@staticmethod
+	def _sprite_size(sprite):
+		return sprite.surface.get_stride() * sprite.surface.get_height()
+
+	def _render(self, source, index):
+		# The sprite is the source rotated around its own top left corner;
+		# origin is where that corner ends up relative to the sprite.
+		rotation_rad = index * self._step_rad
+		(cos, sin) = (math.cos(rotation_rad), math.sin(rotation_rad))
+		(w, h) = (source.dimensions.x, source.dimensions.y)
+		xs = [ (cos * x) - (sin * y) for (x, y) in ((0, 0), (w, 0), (w, h), (0, h)) ]
+		ys = [ (sin * x) + (cos * y) for (x, y) in ((0, 0), (w, 0), (w, h), (0, h)) ]
+		(x0, y0) = (math.floor(min(xs)), math.floor(min(ys)))
+		(x1, y1) = (math.ceil(max(xs)), math.ceil(max(ys)))
+
+		surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, x1 - x0, y1 - y0)
+		cctx = cairo.Context(surface)
+		cctx.translate(-x0, -y0)
+		cctx.rotate(rotation_rad)
+		cctx.set_source_surface(source.surface)
+		cctx.paint()
+		surface.flush()
+		return Sprite(surface = surface, origin = Vector2d(x0, y0), rotation_rad = rotation_rad)
+
+	def _render_unlocked(self, key):
+		# Sprites are rendered without holding the lock; a key is only ever
+		# rendered by one thread at a time, which others wait for.
+		sprite = None
+		try:
+			sprite = self._render(*key)
+		finally:
+			with self._lock:
+				if (sprite is not None) and (key not in self._cache):
+					self._cache.put(key, sprite)
+				self._rendering.discard(key)
+				self._rendered.notify_all()
+		return sprite
+
+	def _prefill_worker(self):
+		while True:
+			key = self._queue.get()
+			with self._lock:
+				self._queued.discard(key)
+				if (key in self._cache) or (key in self._rendering):
+					continue
+				self._rendering.add(key)
+			self._render_unlocked(key)
+
+	def _request_prefill(self, source, index):
+		steps = round(2 * math.pi / self._step_rad)
+		for distance in range(1, self._prefill_count + 1):
+			for neighbor in (index + distance, index - distance):
+				key = (source, neighbor % steps)
+				if (key not in self._cache) and (key not in self._queued):
+					self._queued.add(key)
+					self._queue.put(key)
+
+	def lookup(self, source, rotation_rad):
+		steps = round(2 * math.pi / self._step_rad)
+		index = round(rotation_rad / self._step_rad) % steps
+		key = (source, index)
+		with self._lock:
+			while key in self._rendering:
+				self._rendered.wait()
+			sprite = self._cache.get(key)
+			if sprite is None:
+				self._rendering.add(key)
+			if self._thread is not None:
+				self._request_prefill(source, index)
+		if sprite is None:
+			sprite = self._render_unlocked(key)
+		return sprite
+
+	def __str__(self):
+		with self._lock:
+			return "SpriteCache<%.2f° steps, %s>" % (self._step_rad / math.pi * 180, str(self._cache))
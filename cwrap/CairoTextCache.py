@@ -0,0 +1,86 @@
+import math
+import cairo
+import threading
+import collections
+from geo import Vector2d
+from .ObjectLRUCache import ObjectLRUCache
+
+TextSprite = collections.namedtuple("TextSprite", [ "surface", "origin" ])
+
+# Font objects, text extents and (optionally) rendered text for the Cairo
+# backend. Font faces and scaled fonts are created once per font and size
+# instead of every font_select(), extents are measured once per string and
+# with a surface budget, strings are rasterized once and then only copied.
+class CairoTextCache(object):
+	def __init__(self, max_extents = 4096, surface_bytes = None):
+		self._lock = threading.Lock()
+		self._font_options = cairo.FontOptions()
+		self._font_faces = { }
+		self._scaled_fonts = { }
+		self._extents = ObjectLRUCache(self._measure, max_items = max_extents)
+		if surface_bytes is None:
+			self._surfaces = None
+		else:
+			self._surfaces = ObjectLRUCache(self._render, size_callback = self._sprite_size, max_bytes = surface_bytes)
+
+	@property
+	def caches_surfaces(self):
+		return self._surfaces is not None
+
+	def font_face(self, fontname):
+		face = self._font_faces.get(fontname)
+		if face is None:
+			face = cairo.ToyFontFace(fontname, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+			self._font_faces[fontname] = face
+		return face
+
+	def scaled_font(self, fontname, fontsize):
+		key = (fontname, fontsize)
+		scaled_font = self._scaled_fonts.get(key)
+		if scaled_font is None:
+			scaled_font = cairo.ScaledFont(self.font_face(fontname), cairo.Matrix(xx = fontsize, yy = fontsize), cairo.Matrix(), self._font_options)
+			self._scaled_fonts[key] = scaled_font
+		return scaled_font
+
+	def _measure(self, fontname, fontsize, text):
+		return self.scaled_font(fontname, fontsize).text_extents(text)
+
+	def text_extents(self, fontname, fontsize, text):
+		with self._lock:
+			return self._extents[(fontname, fontsize, text)]
+
+	def font_extents(self, fontname, fontsize):
+		with self._lock:
+			return self.scaled_font(fontname, fontsize).extents()
+
+	@staticmethod
+	def _sprite_size(sprite):
+		return sprite.surface.get_stride() * sprite.surface.get_height()
+
+	def _render(self, fontname, fontsize, fontcolor, text):
+		# origin is the offset of the surface's top left corner relative to
+		# the pen position of the first glyph.
+		(x_bearing, y_bearing, width, height, x_advance, y_advance) = self._measure(fontname, fontsize, text)
+		(x0, y0) = (math.floor(x_bearing) - 1, math.floor(y_bearing) - 1)
+		(x1, y1) = (math.ceil(x_bearing + width) + 1, math.ceil(y_bearing + height) + 1)
+		surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, x1 - x0, y1 - y0)
+		cctx = cairo.Context(surface)
+		cctx.set_scaled_font(self.scaled_font(fontname, fontsize))
+		if fontcolor is not None:
+			fontcolor.cairo_set_source(cctx)
+		else:
+			cctx.set_source_rgb(0, 0, 0)
+		cctx.move_to(-x0, -y0)
+		cctx.show_text(text)
+		surface.flush()
+		return TextSprite(surface = surface, origin = Vector2d(x0, y0))
+
+	def text_surface(self, fontname, fontsize, fontcolor, text):
+		with self._lock:
+			return self._surfaces[(fontname, fontsize, fontcolor, text)]
+
+	def __str__(self):
+		if self._surfaces is None:
+			return "TextCache<%d fonts, extents %s>" % (len(self._scaled_fonts), str(self._extents))
+		else:
+			return "TextCache<%d fonts, extents %s, surfaces %s>" % (len(self._scaled_fonts), str(self._extents), str(self._surfaces))
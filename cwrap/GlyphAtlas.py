@@ -0,0 +1,169 @@
+import math
+import cairo
+import collections
+from .TextMetrics import TextExtents
+from OpenGL.GL import *
+
+Glyph = collections.namedtuple("Glyph", [ "offset_x", "offset_y", "width", "height", "x_bearing", "y_bearing", "inked_width", "inked_height", "x_advance", "uv" ])
+PlacedGlyph = collections.namedtuple("PlacedGlyph", [ "x", "glyph" ])
+
+class GlyphAtlas(object):
+	def __init__(self, state, set_font_callback, flush_callback, page_size = 512, padding = 1):
+		self._state = state
+		self._set_font_callback = set_font_callback
+		self._flush_callback = flush_callback
+		self._page_size = page_size
+		self._padding = padding
+		self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, page_size, page_size)
+		self._cctx = cairo.Context(self._surface)
+		self._measure_cctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+		self._measure_font = None
+		self._texid = None
+		self._dirty_rows = None
+		self._generation = 0
+		self._clear()
+
+	@property
+	def texid(self):
+		return self._texid
+
+	def _clear(self):
+		self._generation += 1
+		self._glyphs = { }
+		self._kerning = { }
+		self._shelf = [ 0, 0, 0 ]
+		self._cctx.save()
+		self._cctx.set_operator(cairo.OPERATOR_CLEAR)
+		self._cctx.paint()
+		self._cctx.restore()
+		self._dirty_rows = (0, self._page_size)
+
+	def _select_measure_font(self, font):
+		if self._measure_font != font:
+			self._set_font_callback(self._measure_cctx, font)
+			self._measure_font = font
+
+	def _allocate(self, width, height):
+		(shelf_x, shelf_y, shelf_height) = self._shelf
+		if shelf_x + width > self._page_size:
+			(shelf_x, shelf_y, shelf_height) = (0, shelf_y + shelf_height, 0)
+		if shelf_y + height > self._page_size:
+			return None
+		self._shelf = [ shelf_x + width, shelf_y, max(shelf_height, height) ]
+		return (shelf_x, shelf_y)
+
+	def _rasterize(self, font, char):
+		self._select_measure_font(font)
+		extents = TextExtents(*self._measure_cctx.text_extents(char))
+		if (extents.width == 0) or (extents.height == 0):
+			return Glyph(offset_x = 0, offset_y = 0, width = 0, height = 0, x_bearing = 0, y_bearing = 0, inked_width = 0, inked_height = 0, x_advance = extents.x_advance, uv = None)
+
+		# The pen is placed on an integral pixel inside the cell, the quad is
+		# later offset by the same amount relative to the (rounded) pen.
+		offset_x = math.floor(extents.x_bearing) - self._padding
+		offset_y = math.floor(extents.y_bearing) - self._padding
+		width = math.ceil(extents.x_bearing + extents.width) - offset_x + self._padding
+		height = math.ceil(extents.y_bearing + extents.height) - offset_y + self._padding
+
+		if (width > self._page_size) or (height > self._page_size):
+			# Can never fit, the glyph only advances the pen
+			return Glyph(offset_x = 0, offset_y = 0, width = 0, height = 0, x_bearing = extents.x_bearing, y_bearing = extents.y_bearing, inked_width = 0, inked_height = 0, x_advance = extents.x_advance, uv = None)
+
+		position = self._allocate(width, height)
+		if position is None:
+			# Atlas is full. Draw everything that still references the old
+			# contents, then start over.
+			self._flush_callback()
+			self._clear()
+			position = self._allocate(width, height)
+		(x, y) = position
+
+		self._set_font_callback(self._cctx, font)
+		self._cctx.move_to(x - offset_x, y - offset_y)
+		self._cctx.show_text(char)
+		if self._dirty_rows is None:
+			self._dirty_rows = (y, y + height)
+		else:
+			self._dirty_rows = (min(self._dirty_rows[0], y), max(self._dirty_rows[1], y + height))
+
+		uv = (x / self._page_size, y / self._page_size, (x + width) / self._page_size, (y + height) / self._page_size)
+		return Glyph(offset_x = offset_x, offset_y = offset_y, width = width, height = height, x_bearing = extents.x_bearing, y_bearing = extents.y_bearing, inked_width = extents.width, inked_height = extents.height, x_advance = extents.x_advance, uv = uv)
+
+	def _glyph(self, font, char):
+		key = (font, char)
+		glyph = self._glyphs.get(key)
+		if glyph is None:
+			glyph = self._rasterize(font, char)
+			self._glyphs[key] = glyph
+		return glyph
+
+	def _kerning_adjustment(self, font, left, right):
+		key = (font, left, right)
+		adjustment = self._kerning.get(key)
+		if adjustment is None:
+			self._select_measure_font(font)
+			pair_advance = self._measure_cctx.text_extents(left + right)[4]
+			adjustment = pair_advance - self._glyph(font, left).x_advance - self._glyph(font, right).x_advance
+			self._kerning[key] = adjustment
+		return adjustment
+
+	def layout(self, font, text):
+		# When the atlas runs full while laying out the text, the glyphs that
+		# were placed before refer to cells that are gone; the text is laid
+		# out again on the fresh page then.
+		generation = self._generation
+		result = self._layout(font, text)
+		if self._generation != generation:
+			generation = self._generation
+			result = self._layout(font, text)
+			if self._generation != generation:
+				raise Exception("Glyphs of text %s do not fit into one %d x %d glyph atlas page." % (repr(text), self._page_size, self._page_size))
+		return result
+
+	def _layout(self, font, text):
+		placed = [ ]
+		pen = 0
+		(min_x, min_y, max_x, max_y) = (None, None, None, None)
+		previous = None
+		for char in text:
+			if previous is not None:
+				pen += self._kerning_adjustment(font, previous, char)
+			glyph = self._glyph(font, char)
+			placed.append(PlacedGlyph(x = pen, glyph = glyph))
+			if glyph.uv is not None:
+				(x0, y0) = (pen + glyph.x_bearing, glyph.y_bearing)
+				(x1, y1) = (x0 + glyph.inked_width, y0 + glyph.inked_height)
+				if min_x is None:
+					(min_x, min_y, max_x, max_y) = (x0, y0, x1, y1)
+				else:
+					(min_x, min_y, max_x, max_y) = (min(min_x, x0), min(min_y, y0), max(max_x, x1), max(max_y, y1))
+			pen += glyph.x_advance
+			previous = char
+		if min_x is None:
+			(min_x, min_y, max_x, max_y) = (0, 0, 0, 0)
+		text_extents = TextExtents(x_bearing = min_x, y_bearing = min_y, width = max_x - min_x, height = max_y - min_y, x_advance = pen, y_advance = 0)
+		return (placed, text_extents)
+
+	def upload(self):
+		if self._dirty_rows is None:
+			return
+		if self._texid is None:
+			self._texid = self._state.call(glGenTextures, 1)
+			self._state.bind_texture(self._texid)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+			self._state.call(glTexImage2D, GL_TEXTURE_2D, 0, GL_RGBA, self._page_size, self._page_size, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+		else:
+			self._state.bind_texture(self._texid)
+
+		(first_row, end_row) = self._dirty_rows
+		self._surface.flush()
+		stride = self._surface.get_stride()
+		rows = bytes(self._surface.get_data()[first_row * stride : end_row * stride])
+		self._state.call(glTexSubImage2D, GL_TEXTURE_2D, 0, 0, first_row, self._page_size, end_row - first_row, GL_RGBA, GL_UNSIGNED_BYTE, rows)
+		self._dirty_rows = None
+
+	def __str__(self):
+		return "GlyphAtlas<%d glyphs>" % (len(self._glyphs))
@@ -0,0 +1,102 @@
+import collections
+
+CacheStats = collections.namedtuple("CacheStats", [ "hits", "misses", "evictions", "items", "size_bytes", "max_bytes" ])
+
+class ObjectLRUCache(object):
+	def __init__(self, create_callback, purge_callback = None, size_callback = None, max_bytes = None, max_items = None):
+		self._create_callback = create_callback
+		self._purge_callback = purge_callback
+		self._size_callback = size_callback
+		self._max_bytes = max_bytes
+		self._max_items = max_items
+		self._cache = collections.OrderedDict()
+		self._size_bytes = 0
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
+
+	@property
+	def stats(self):
+		return CacheStats(hits = self._hits, misses = self._misses, evictions = self._evictions, items = len(self._cache), size_bytes = self._size_bytes, max_bytes = self._max_bytes)
+
+	@property
+	def size_bytes(self):
+		return self._size_bytes
+
+	def reset_stats(self):
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
+
+	def _over_budget(self):
+		if (self._max_bytes is not None) and (self._size_bytes > self._max_bytes):
+			return True
+		if (self._max_items is not None) and (len(self._cache) > self._max_items):
+			return True
+		return False
+
+	def _evict(self):
+		# Least recently used entries are at the front. The entry that was
+		# inserted last is never evicted, even if it alone exceeds the budget.
+		evicted = [ ]
+		while self._over_budget() and (len(self._cache) > 1):
+			(key, (item, size)) = self._cache.popitem(last = False)
+			self._size_bytes -= size
+			evicted.append(item)
+		if len(evicted) > 0:
+			self._evictions += len(evicted)
+			if self._purge_callback is not None:
+				self._purge_callback(evicted)
+
+	def purge(self):
+		items = [ item for (item, size) in self._cache.values() ]
+		self._cache.clear()
+		self._size_bytes = 0
+		if (len(items) > 0) and (self._purge_callback is not None):
+			self._purge_callback(items)
+
+	def get(self, key):
+		# Lookup without creating the object on a miss; a caller that creates
+		# it itself then hands it to put().
+		entry = self._cache.get(key)
+		if entry is None:
+			self._misses += 1
+			return None
+		self._hits += 1
+		self._cache.move_to_end(key)
+		return entry[0]
+
+	def put(self, key, item):
+		if key in self._cache:
+			(old_item, old_size) = self._cache.pop(key)
+			self._size_bytes -= old_size
+			if self._purge_callback is not None:
+				self._purge_callback([ old_item ])
+		size = self._size_callback(item) if (self._size_callback is not None) else 0
+		self._cache[key] = (item, size)
+		self._size_bytes += size
+		self._evict()
+
+	def __getitem__(self, key):
+		entry = self._cache.get(key)
+		if entry is not None:
+			self._hits += 1
+			self._cache.move_to_end(key)
+			return entry[0]
+
+		# Item not in cache. Create and insert.
+		self._misses += 1
+		item = self._create_callback(*key)
+		self.put(key, item)
+		return item
+
+	def __contains__(self, key):
+		return key in self._cache
+
+	def __len__(self):
+		return len(self._cache)
+
+	def __str__(self):
+		lookups = self._hits + self._misses
+		hit_rate = (100 * self._hits / lookups) if (lookups > 0) else 0
+		return "Cache<%d items, %.1f kiB, %.1f%% hits, %d evictions>" % (len(self._cache), self._size_bytes / 1024, hit_rate, self._evictions)
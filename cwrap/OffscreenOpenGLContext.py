@@ -0,0 +1,58 @@
+import os
+if os.environ.get("PYOPENGL_PLATFORM") != "osmesa":
+	raise Exception("Offscreen rendering requires PYOPENGL_PLATFORM=osmesa to be set before OpenGL is first imported.")
+
+import cairo
+from .OpenGLContext import OpenGLContext
+from OpenGL.GL import *
+from OpenGL import osmesa
+from OpenGL import arrays
+
+# OpenGL context that renders with Mesa's software rasterizer into a client
+# side buffer, so the GL path can run on machines without any display.
+class OffscreenOpenGLContext(OpenGLContext):
+	def __init__(self, dimensions, **kwargs):
+		self._osmesa_ctx = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 0, 0, 0, None)
+		if not self._osmesa_ctx:
+			raise Exception("Could not create OSMesa context.")
+		self._framebuffer = arrays.GLubyteArray.zeros((dimensions.y, dimensions.x, 4))
+		if not osmesa.OSMesaMakeCurrent(self._osmesa_ctx, self._framebuffer, GL_UNSIGNED_BYTE, dimensions.x, dimensions.y):
+			raise Exception("Could not make OSMesa context current.")
+		OpenGLContext.__init__(self, dimensions, **kwargs)
+		self.initialize_state()
+
+	def begin_frame(self):
+		self.clear()
+
+	def finish(self):
+		# Waits until the rasterizer is done so that frame timings include
+		# the actual drawing, not just the submission.
+		self._state.call(glFinish)
+
+	def read_pixels(self):
+		self.flush()
+		pixels = self._state.call(glReadPixels, 0, 0, self._dimensions.x, self._dimensions.y, GL_RGBA, GL_UNSIGNED_BYTE)
+		return bytes(pixels)
+
+	def write_to_png(self, filename):
+		# Textures are uploaded with red and blue swapped, so the framebuffer
+		# bytes are already in Cairo's in-memory order; only the row order
+		# needs to be flipped.
+		pixels = self.read_pixels()
+		surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self._dimensions.x, self._dimensions.y)
+		stride = surface.get_stride()
+		row_length = 4 * self._dimensions.x
+		data = surface.get_data()
+		for y in range(self._dimensions.y):
+			source_row = (self._dimensions.y - 1 - y) * row_length
+			data[y * stride : y * stride + row_length] = pixels[source_row : source_row + row_length]
+		surface.mark_dirty()
+		surface.write_to_png(filename)
+
+	def destroy(self):
+		if self._osmesa_ctx is not None:
+			osmesa.OSMesaDestroyContext(self._osmesa_ctx)
+			self._osmesa_ctx = None
+
+	def __str__(self):
+		return "OffscreenOpenGLContext<%s>" % (self._dimensions)
@@ -1,151 +1,412 @@
+import os
 import time
 import sys
 import math
 import cairo
 import collections
+import concurrent.futures
 from geo import Vector2d, Box2d
-from . import TextExtents
+from .TextMetrics import TextExtents
+from .ObjectLRUCache import ObjectLRUCache
+from .OpenGLState import OpenGLState
+from .OpenGLQuadBatch import OpenGLQuadBatch
+from .OpenGLTexturePool import OpenGLTexturePool
+from .TextureAtlas import TextureAtlas
+from .TextureCache import TextureCache
+from .GlyphAtlas import GlyphAtlas
+from .TextMetrics import TextMetrics
 from OpenGL.GL import *
 
-OpenGLTexture = collections.namedtuple("OpenGLTexture", [ "texid", "dimension", "surface_dimension", "filename", "maxx", "maxy", "text_extents" ])
+OpenGLTexture = collections.namedtuple("OpenGLTexture", [ "texid", "dimension", "surface_dimension", "filename", "minx", "miny", "maxx", "maxy", "text_extents" ])
 OpenGLTexturePromise = collections.namedtuple("OpenGLTexturePromise", [ "dimension", "filename", "texture" ])
+OpenGLCompositePromise = collections.namedtuple("OpenGLCompositePromise", [ "dimension", "filename", "layers", "texture" ])
 SelectedFont = collections.namedtuple("SelectedFont", [ "name", "size", "color" ])
 RenderedText = collections.namedtuple("RenderedText", [ "font", "text", "textureid" ])
+PreparedAtlas = collections.namedtuple("PreparedAtlas", [ "promises", "atlas", "page_size", "timings" ])
+OpenGLRenderTarget = collections.namedtuple("OpenGLRenderTarget", [ "fbo", "origin", "source" ])
 
-class ObjectLRUCache(object):
-	def __init__(self, create_callback, purge_callback, purge_timeout = 5):
-		self._create_callback = create_callback
-		self._purge_callback = purge_callback
-		self._purge_timeout = purge_timeout
-		self._autopurge_interval = 1
-		self._last_purge = time.time()
-		self._cache = { }
-
-	def purge(self):
-		now = time.time()
-		self._last_purge = now
-		delete_keys = [ ]
-		delete_items = [ ]
-		for (key, (lastuse_time, item)) in self._cache.items():
-			if (now - lastuse_time) > self._purge_timeout:
-				delete_items.append(item)
-				delete_keys.append(key)
-		if len(delete_items) > 0:
-			self._purge_callback(delete_items)
-			for key in delete_keys:
-				del self._cache[key]
-
-	def _auto_purge(self):
-		time_since_last_purge = time.time() - self._last_purge
-		if time_since_last_purge > self._autopurge_interval:
-			self.purge()
-
-	def __getitem__(self, key):
-		try:
-			item = self._cache.get(key)
-			if item is not None:
-				# Item is cached. Reset timestamp and return object.
-				item[0] = time.time()
-				return item[1]
+class OpenGLContext(object):
+	_depth = 1
+	_MAX_ATLAS_SIZE = 2048
+	_TEXTURE_CACHE_FILENAME = "texture_cache.bin"
+	# Layers are loaded through class methods before any context exists. They
+	# wait here until preload() or the first context to be created claims
+	# them; each context then only finishes the promises it owns.
+	_unclaimed_promises = [ ]
+	_IDENTITY = (1, 0, 0, 1, 0, 0)
+
+	def __init__(self, dimensions, glyph_atlas = True, text_cache_bytes = 4 * 1024 * 1024, use_pbo = False):
+		self._dimensions = dimensions
+		self._selected_font = None
+		self._state = OpenGLState()
+		self._texture_pool = OpenGLTexturePool(self._state, use_pbo = use_pbo)
+		self._text_cache = ObjectLRUCache(self.render_text_to_texture, self._delete_text_textures, size_callback = self._text_texture_size, max_bytes = text_cache_bytes)
+		self._batch = OpenGLQuadBatch(dimensions, self._state)
+		if glyph_atlas:
+			self._glyph_atlas = GlyphAtlas(self._state, self._cctx_set_font, self._batch.flush)
+		else:
+			self._glyph_atlas = None
+		self._transform = self._IDENTITY
+		self._region_scissor = None
+		self._scissor = None
+		self._clear_color = None
+		self._target = None
+		self._target_restore = None
+		self._pending_promises = self._take_pending_promises()
+
+	@property
+	def dimensions(self):
+		return self._dimensions
+
+	@property
+	def text_cache(self):
+		return self._text_cache
+
+	@property
+	def texture_pool(self):
+		return self._texture_pool
+
+	@property
+	def state(self):
+		return self._state
 
-			# Item not in cache. Create
-			new_item = self._create_callback(*key)
+	@classmethod
+	def _text_texture_size(cls, texture):
+		return 4 * cls._next_pwr2(texture.dimension.x) * cls._next_pwr2(texture.dimension.y)
 
-			# Insert into cache and return object
-			self._cache[key] = [ time.time(), new_item ]
-			return new_item
-		finally:
-			self._auto_purge()
+	def initialize_state(self, clear_color = (0.5, 0.5, 0.5, 0)):
+		# Global GL state that the renderer relies on; needs a current context.
+		self._state.viewport(0, 0, self._dimensions.x, self._dimensions.y)
+		self._clear_color = clear_color
+		self._state.call(glClearColor, *clear_color)
+		self._state.call(glClear, GL_COLOR_BUFFER_BIT)
 
-	def __str__(self):
-		return "Cache<%d>" % (len(self._cache))
+		self._state.call(glEnable, GL_TEXTURE_2D)
+		self._state.call(glEnable, GL_ALPHA_TEST)
 
-class OpenGLContext(object):
-	_depth = 1
-
-	def __init__(self):
-		self._selected_font = None
-		self._text_cache = ObjectLRUCache(self.render_text_to_texture, self._delete_text_textures)
+		self._state.call(glEnable, GL_BLEND)
+		self._state.call(glBlendEquation, GL_FUNC_ADD)
+		self._state.blend_func(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
 
 	def _delete_text_textures(self, textures):
-		texids = [ texture.texid for texture in textures ]
-		glDeleteTextures(texids)
+		# Textures might still be referenced by quads that have not been
+		# submitted yet, so flush before handing them back for reuse.
+		self._batch.flush()
+		for texture in textures:
+			self._texture_pool.release(texture.texid, self._next_pwr2(texture.dimension.x), self._next_pwr2(texture.dimension.y))
 
 	@classmethod
 	def load_from_png(cls, png_filename, dimension):
-		return OpenGLTexturePromise(dimension = dimension, filename = png_filename, texture = [ ])
+		promise = OpenGLTexturePromise(dimension = dimension, filename = png_filename, texture = [ ])
+		cls._unclaimed_promises.append(promise)
+		return promise
+
+	@classmethod
+	def flatten_layers(cls, dimensions, layers):
+		# Layers are (source, offset, clip) tuples in the coordinates of the
+		# flattened image. Nothing is decoded here: the composite takes the
+		# place of its layers in the atlas and is drawn when that is built.
+		for (source, offset, clip) in layers:
+			if source in cls._unclaimed_promises:
+				cls._unclaimed_promises.remove(source)
+		promise = OpenGLCompositePromise(dimension = dimensions, filename = None, layers = layers, texture = [ ])
+		cls._unclaimed_promises.append(promise)
+		return promise
+
+	@staticmethod
+	def _promise_sources(promise):
+		if isinstance(promise, OpenGLCompositePromise):
+			return [ source for (source, offset, clip) in promise.layers ]
+		else:
+			return [ promise ]
+
+	@staticmethod
+	def _promise_layout(promise):
+		if isinstance(promise, OpenGLCompositePromise):
+			layers = [ ]
+			for (source, offset, clip) in promise.layers:
+				clip = None if (clip is None) else [ clip.base.x, clip.base.y, clip.dimensions.x, clip.dimensions.y ]
+				layers.append([ offset.x, offset.y, clip ])
+			return [ promise.dimension.x, promise.dimension.y, layers ]
+		else:
+			return None
+
+	@staticmethod
+	def _composite_surface(promise, surfaces):
+		# Layers are drawn at their displayed size, which is also the
+		# resolution the atlas stores them at.
+		composite = cairo.ImageSurface(cairo.FORMAT_ARGB32, math.ceil(promise.dimension.x), math.ceil(promise.dimension.y))
+		cctx = cairo.Context(composite)
+		for ((source, offset, clip), surface) in zip(promise.layers, surfaces):
+			cctx.save()
+			if clip is not None:
+				cctx.rectangle(clip.base.x, clip.base.y, clip.dimensions.x, clip.dimensions.y)
+				cctx.clip()
+			cctx.translate(offset.x, offset.y)
+			cctx.scale(source.dimension.x / surface.get_width(), source.dimension.y / surface.get_height())
+			cctx.set_source_surface(surface)
+			cctx.paint()
+			cctx.restore()
+		composite.flush()
+		return composite
+
+	def _create_texture(self, dimension, rgba_data):
+		texture_id = self._state.call(glGenTextures, 1)
+		self._state.bind_texture(texture_id)
+		self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+		self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+		self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+		self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+		self._state.call(glTexImage2D, GL_TEXTURE_2D, 0, GL_RGBA, dimension.x, dimension.y, 0, GL_RGBA, GL_UNSIGNED_BYTE, rgba_data)
+		return texture_id
+
+	@classmethod
+	def _take_pending_promises(cls):
+		promises = [ pending for pending in cls._unclaimed_promises if len(pending.texture) == 0 ]
+		del cls._unclaimed_promises[:]
+		return promises
+
+	@classmethod
+	def _prepare_atlas(cls, promises, page_size, decode_threads = 1):
+		# Packed atlas pages are kept as raw pixels next to the source images
+		# and rebuilt whenever any of the sources change. Nothing in here
+		# touches OpenGL, so it may run before the GL context exists.
+		timings = collections.OrderedDict()
+		t0 = time.time()
+		sources = [ source for pending in promises for source in cls._promise_sources(pending) ]
+		cache_filename = os.path.join(os.path.dirname(sources[0].filename), cls._TEXTURE_CACHE_FILENAME)
+		signature = TextureCache.signature([ (source.filename, source.dimension) for source in sources ], page_size, layouts = [ cls._promise_layout(pending) for pending in promises ])
+		atlas = TextureCache.load(cache_filename, signature)
+		timings["cache lookup"] = time.time() - t0
+		if atlas is not None:
+			return PreparedAtlas(promises = promises, atlas = atlas, page_size = page_size, timings = timings)
+
+		t0 = time.time()
+		with concurrent.futures.ThreadPoolExecutor(max_workers = decode_threads) as executor:
+			decoded = iter(executor.map(cairo.ImageSurface.create_from_png, [ source.filename for source in sources ]))
+			surfaces = [ ]
+			for pending in promises:
+				if isinstance(pending, OpenGLCompositePromise):
+					surfaces.append(cls._composite_surface(pending, [ next(decoded) for layer in pending.layers ]))
+				else:
+					surfaces.append(next(decoded))
+		timings["PNG decoding"] = time.time() - t0
+
+		t0 = time.time()
+		images = [ (index, surface, pending.dimension) for (index, (surface, pending)) in enumerate(zip(surfaces, promises)) ]
+		atlas = TextureAtlas.build(images, page_size = page_size)
+		timings["atlas packing"] = time.time() - t0
+
+		t0 = time.time()
+		try:
+			TextureCache.write(cache_filename, signature, atlas)
+		except OSError as e:
+			print("Could not write texture cache %s: %s" % (cache_filename, str(e)), file = sys.stderr)
+		timings["cache writing"] = time.time() - t0
+		return PreparedAtlas(promises = promises, atlas = atlas, page_size = page_size, timings = timings)
+
+	@classmethod
+	def preload(cls, decode_threads = 4):
+		# Decodes and packs all layers loaded so far on a background thread;
+		# the result is handed to upload_preloaded() once GL is up.
+		promises = cls._take_pending_promises()
+		executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+		if len(promises) == 0:
+			future = executor.submit(lambda: None)
+		else:
+			future = executor.submit(cls._prepare_atlas, promises, cls._MAX_ATLAS_SIZE, decode_threads)
+		executor.shutdown(wait = False)
+		return future
+
+	def upload_preloaded(self, future):
+		prepared = future.result()
+		if prepared is None:
+			return None
+		max_texture_size = int(glGetIntegerv(GL_MAX_TEXTURE_SIZE))
+		if prepared.page_size > max_texture_size:
+			prepared = self._prepare_atlas(prepared.promises, max_texture_size)
+		t0 = time.time()
+		self._upload_atlas(prepared)
+		prepared.timings["texture upload"] = time.time() - t0
+		return prepared
+
+	def _upload_atlas(self, prepared):
+		page_texids = [ ]
+		for page in prepared.atlas.pages:
+			page_texids.append(self._create_texture(Vector2d(page.width, page.height), page.data))
+
+		for (index, pending) in enumerate(prepared.promises):
+			entry = prepared.atlas.entries[index]
+			(minx, miny, maxx, maxy) = entry.uv
+			texture = OpenGLTexture(texid = page_texids[entry.page], dimension = pending.dimension, surface_dimension = Vector2d(entry.width, entry.height), filename = pending.filename, minx = minx, miny = miny, maxx = maxx, maxy = maxy, text_extents = None)
+			pending.texture.append(texture)
 
 	def _finish_texture(self, promise):
 		if len(promise.texture) != 0:
 			return
-		surface = cairo.ImageSurface.create_from_png(promise.filename)
-		surface_dimension = Vector2d(surface.get_width(), surface.get_height())
-		rgba_data = bytes(surface.get_data())
-		assert(len(rgba_data) == 4 * surface_dimension.x * surface_dimension.y)
-
-		texture_id = glGenTextures(1)
-		glBindTexture(GL_TEXTURE_2D, texture_id)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, surface_dimension.x, surface_dimension.y, 0, GL_RGBA, GL_UNSIGNED_BYTE, rgba_data)
-		texture = OpenGLTexture(texid = texture_id, dimension = promise.dimension, surface_dimension = surface_dimension, filename = promise.filename, maxx = 1, maxy = 1, text_extents = None)
-		promise.texture.append(texture)
-		return texture
+		# All layers that have been loaded so far are packed into a shared
+		# atlas at once so that they can be drawn without rebinding textures.
+		promises = [ pending for pending in self._pending_promises + self._take_pending_promises() if len(pending.texture) == 0 ]
+		self._pending_promises = [ ]
+		if promise not in promises:
+			promises.append(promise)
+
+		page_size = min(self._MAX_ATLAS_SIZE, int(glGetIntegerv(GL_MAX_TEXTURE_SIZE)))
+		prepared = self._prepare_atlas(promises, page_size)
+		self._upload_atlas(prepared)
+		print("Loaded %s on first use" % (prepared.atlas), file = sys.stderr)
+
+	@staticmethod
+	def _multiply(m1, m2):
+		# Affine transformations in Cairo's (xx, yx, xy, yy, x0, y0) notation;
+		# the result applies m2 first, then m1.
+		(a1, b1, c1, d1, e1, f1) = m1
+		(a2, b2, c2, d2, e2, f2) = m2
+		return (a1 * a2 + c1 * b2, b1 * a2 + d1 * b2, a1 * c2 + c1 * d2, b1 * c2 + d1 * d2, a1 * e2 + c1 * f2 + e1, b1 * e2 + d1 * f2 + f1)
+
+	def _screen_scissor(self, clip):
+		if self._target is None:
+			# The screen is drawn into the current viewport, which the window
+			# may letterbox and scale; scissor boxes are in window pixels with
+			# the first row at the bottom. Partially covered pixels are
+			# included so that nothing stale is left at the edges.
+			viewport = self._state.current_viewport
+			if viewport is None:
+				viewport = (0, 0, self._dimensions.x, self._dimensions.y)
+			(vx, vy, vw, vh) = viewport
+			(sx, sy) = (vw / self._dimensions.x, vh / self._dimensions.y)
+			(x0, x1) = (vx + (clip.base.x * sx), vx + ((clip.base.x + clip.dimensions.x) * sx))
+			(y0, y1) = (vy + ((self._dimensions.y - (clip.base.y + clip.dimensions.y)) * sy), vy + ((self._dimensions.y - clip.base.y) * sy))
+			(x0, y0, x1, y1) = (math.floor(x0), math.floor(y0), math.ceil(x1), math.ceil(y1))
+			return (x0, y0, x1 - x0, y1 - y0)
+		else:
+			# Render targets are drawn with a flipped projection, so their
+			# first row is the top of the box they cover.
+			origin = self._target.origin
+			return (round(clip.base.x - origin.x), round(clip.base.y - origin.y), round(clip.dimensions.x), round(clip.dimensions.y))
+
+	@staticmethod
+	def _intersect_scissor(scissor1, scissor2):
+		if scissor1 is None:
+			return scissor2
+		if scissor2 is None:
+			return scissor1
+		(x0, y0) = (max(scissor1[0], scissor2[0]), max(scissor1[1], scissor2[1]))
+		(x1, y1) = (min(scissor1[0] + scissor1[2], scissor2[0] + scissor2[2]), min(scissor1[1] + scissor1[3], scissor2[1] + scissor2[3]))
+		return (x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+	def set_region(self, region):
+		# Restricts all following drawing (including clear()) to the given
+		# screen box; None draws to the whole screen again.
+		if region is None:
+			self._region_scissor = None
+		else:
+			self._region_scissor = self._screen_scissor(region)
+		self._scissor = self._region_scissor
+
+	def clear(self):
+		self._batch.flush()
+		self._state.set_scissor(self._region_scissor)
+		self._state.call(glClear, GL_COLOR_BUFFER_BIT)
 
 	def blit(self, source, offset = None, clip = None, rotation_rad = None, center_of_rotation = None, clipped_callback = None):
-		if isinstance(source, OpenGLTexturePromise):
+		if isinstance(source, (OpenGLTexturePromise, OpenGLCompositePromise)):
 			if len(source.texture) == 0:
 				self._finish_texture(source)
 			source = source.texture[0]
 
-		depth = 0
-
-		glBindTexture(GL_TEXTURE_2D, source.texid)
-
-		glPushMatrix()
-
+		(previous_transform, previous_scissor) = (self._transform, self._scissor)
 		if clip is True:
 			# Keep clipping but do not modify any settings.
 			pass
 		elif (clip is None) or (clip is False):
-			glDisable(GL_SCISSOR_TEST)
+			self._scissor = self._region_scissor
 		else:
-			glEnable(GL_SCISSOR_TEST)
-			glScissor(round(clip.base.x), round(720 - (clip.base.y + clip.dimensions.y)), round(clip.dimensions.x), round(clip.dimensions.y))
+			self._scissor = self._intersect_scissor(self._screen_scissor(clip), self._region_scissor)
 
+		transform = self._transform
 		if rotation_rad is not None:
-			glTranslate(center_of_rotation.x, center_of_rotation.y, 0)
-			glRotate(180 / math.pi * rotation_rad, 0, 0, 1)
-			glTranslate(-center_of_rotation.x, -center_of_rotation.y, 0)
+			(cos, sin) = (math.cos(rotation_rad), math.sin(rotation_rad))
+			(cx, cy) = (center_of_rotation.x, center_of_rotation.y)
+			transform = self._multiply(transform, (cos, sin, -sin, cos, cx - (cos * cx) + (sin * cy), cy - (sin * cx) - (cos * cy)))
 
 		if offset is None:
 			offset = Vector2d(0, 0)
 
 		if source.text_extents is not None:
 			offset += Vector2d(0, source.text_extents.y_bearing)
-		glTranslate(offset.x, offset.y, 0)
+		transform = self._multiply(transform, (1, 0, 0, 1, offset.x, offset.y))
 
-		glBegin(GL_QUADS)
-		glTexCoord2f(0, 0)
-		glVertex3f(0, 0, depth)
-
-		glTexCoord2f(source.maxx, 0)
-		glVertex3f(source.dimension.x, 0, depth)
-
-		glTexCoord2f(source.maxx, source.maxy)
-		glVertex3f(source.dimension.x, source.dimension.y, depth)
-
-		glTexCoord2f(0, source.maxy)
-		glVertex3f(0, source.dimension.y, depth)
-		glEnd()
+		(a, b, c, d, e, f) = transform
+		(w, h) = (source.dimension.x, source.dimension.y)
+		corners = ((e, f), ((a * w) + e, (b * w) + f), ((a * w) + (c * h) + e, (b * w) + (d * h) + f), ((c * h) + e, (d * h) + f))
+		self._batch.add_quad(source.texid, self._scissor, corners, (source.minx, source.miny, source.maxx, source.maxy))
 
 		if clipped_callback is not None:
+			self._transform = transform
 			clipped_callback(self, offset)
 
-		glPopMatrix()
-		glDisable(GL_SCISSOR_TEST)
+		self._transform = previous_transform
+		if clip is True:
+			self._scissor = previous_scissor
+		else:
+			self._scissor = self._region_scissor
+
+	def create_render_target(self, box):
+		# Offscreen texture that covers the given screen box. Drawing into it
+		# uses the same screen coordinates as drawing onto the screen.
+		(width, height) = (round(box.dimensions.x), round(box.dimensions.y))
+		(texture_width, texture_height) = (self._next_pwr2(width), self._next_pwr2(height))
+		# Group sizes are all different, so the target gets its own texture
+		# rather than a pool bucket that would be grown for a single use.
+		texid = self._create_texture(Vector2d(texture_width, texture_height), None)
+		fbo = self._state.call(glGenFramebuffers, 1)
+		self._state.call(glBindFramebuffer, GL_FRAMEBUFFER, fbo)
+		self._state.call(glFramebufferTexture2D, GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, texid, 0)
+		status = self._state.call(glCheckFramebufferStatus, GL_FRAMEBUFFER)
+		self._state.call(glBindFramebuffer, GL_FRAMEBUFFER, 0)
+		if status != GL_FRAMEBUFFER_COMPLETE:
+			raise Exception("Framebuffer for render target %s is incomplete (status 0x%x)." % (box, status))
+		texture = OpenGLTexture(texid = texid, dimension = Vector2d(width, height), surface_dimension = Vector2d(texture_width, texture_height), filename = None, minx = 0, miny = 0, maxx = width / texture_width, maxy = height / texture_height, text_extents = None)
+		return OpenGLRenderTarget(fbo = fbo, origin = box.base, source = texture)
+
+	def begin_render_target(self, target):
+		# Returns the context to draw the target's content with, which is
+		# this context redirected into the target until end_render_target().
+		self._batch.flush()
+		self._target_restore = (self._state.current_viewport, self._region_scissor)
+		self._target = target
+		(self._region_scissor, self._scissor) = (None, None)
+		self._state.call(glBindFramebuffer, GL_FRAMEBUFFER, target.fbo)
+		self._state.viewport(0, 0, target.source.dimension.x, target.source.dimension.y)
+		self._batch.set_projection(target.source.dimension, origin = target.origin, flip_y = True)
+		self._state.call(glClearColor, 0, 0, 0, 0)
+		self._state.call(glClear, GL_COLOR_BUFFER_BIT)
+		self._state.call(glClearColor, *self._clear_color)
+		return self
+
+	def end_render_target(self, target):
+		self._batch.flush()
+		self._state.call(glBindFramebuffer, GL_FRAMEBUFFER, 0)
+		(viewport, self._region_scissor) = self._target_restore
+		self._scissor = self._region_scissor
+		self._target = None
+		if viewport is not None:
+			self._state.viewport(*viewport)
+		self._batch.set_projection(self._dimensions)
+
+	def delete_render_target(self, target):
+		self._batch.flush()
+		self._state.call(glDeleteFramebuffers, 1, [ target.fbo ])
+		self._state.call(glDeleteTextures, [ target.source.texid ])
+		self._state.textures_deleted([ target.source.texid ])
+
+	def flush(self):
+		self._batch.flush()
+
+	def end_frame(self):
+		self._batch.flush()
+		return self._state.end_frame()
 
 	@staticmethod
 	def _next_pwr2(value):
@@ -156,7 +417,13 @@ class OpenGLContext(object):
 	def _cctx_set_font(self, cctx, font_params):
 		cctx.select_font_face(font_params.name, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
 		cctx.set_font_size(font_params.size)
-		font_params.color.cairo_set_source(cctx)
+		# Cairo stores pixels as BGRA in memory, but they are uploaded as
+		# GL_RGBA; swap red and blue to compensate.
+		color = font_params.color
+		if color is not None:
+			cctx.set_source_rgba(color.b, color.g, color.r, color.a)
+		else:
+			cctx.set_source_rgb(0, 0, 0)
 
 	def render_text_to_texture(self, selected_font, text):
 		# Determine size first by creating a dummy surface
@@ -180,51 +447,44 @@ class OpenGLContext(object):
 		cctx.show_text(text)
 
 		# Now create texture from it
-		rgba_data = bytes(surface.get_data())
-		texture_id = glGenTextures(1)
-		glBindTexture(GL_TEXTURE_2D, texture_id)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, gl_width, gl_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, rgba_data)
-		texture = OpenGLTexture(texid = texture_id, dimension = Vector2d(width, height), surface_dimension = Vector2d(width, height), filename = None, maxx = width / gl_width, maxy = height / gl_height, text_extents = text_extents)
+		surface.flush()
+		texture_id = self._texture_pool.acquire(gl_width, gl_height)
+		self._texture_pool.upload(texture_id, gl_width, gl_height, bytes(surface.get_data()))
+		texture = OpenGLTexture(texid = texture_id, dimension = Vector2d(width, height), surface_dimension = Vector2d(width, height), filename = None, minx = 0, miny = 0, maxx = width / gl_width, maxy = height / gl_height, text_extents = text_extents)
 		return texture
 
 	def font_select(self, fontname, fontsize, fontcolor = None):
 		self._selected_font = SelectedFont(name = fontname, size = fontsize, color = fontcolor)
 
+	def _glyph_text(self, pos, text, anchor):
+		(placed_glyphs, text_extents) = self._glyph_atlas.layout(self._selected_font, text)
+		self._glyph_atlas.upload()
+		pos = TextMetrics.anchor_position(pos, text_extents, anchor)
+
+		# Pen positions are snapped to device pixels so that glyphs are
+		# sampled 1:1 from the atlas.
+		(a, b, c, d, e, f) = self._transform
+		texid = self._glyph_atlas.texid
+		for (x, glyph) in placed_glyphs:
+			if glyph.uv is None:
+				continue
+			(px, py) = (pos.x + x, pos.y)
+			(px, py) = (round((a * px) + (c * py) + e), round((b * px) + (d * py) + f))
+			(x0, y0) = (glyph.offset_x, glyph.offset_y)
+			(x1, y1) = (x0 + glyph.width, y0 + glyph.height)
+			corners = (
+				((a * x0) + (c * y0) + px, (b * x0) + (d * y0) + py),
+				((a * x1) + (c * y0) + px, (b * x1) + (d * y0) + py),
+				((a * x1) + (c * y1) + px, (b * x1) + (d * y1) + py),
+				((a * x0) + (c * y1) + px, (b * x0) + (d * y1) + py),
+			)
+			self._batch.add_quad(texid, self._scissor, corners, glyph.uv)
+
 	def text(self, pos, text, anchor = "tl"):
-		# Anchor is one of top/center/bottom - left/center/right combinations
-		assert(len(anchor) == 2)
-		(valign, halign) = anchor
-		assert(valign in "tcb")
-		assert(halign in "lcr")
+		if self._glyph_atlas is not None:
+			return self._glyph_text(pos, text, anchor)
 
 		key = (self._selected_font, text)
 		texture = self._text_cache[key]
-		if valign == "b":
-			# Baseline, Cairo default
-			pass
-		elif valign == "t":
-			# Top left
-			pos -= Vector2d(0, texture.text_extents.y_bearing)
-		elif valign == "c":
-			# Center left
-			pos -= Vector2d(0, texture.text_extents.y_bearing / 2)
-		else:
-			raise Exception(NotImplemented)
-
-		if halign == "l":
-			# Left-aligned, Cairo default
-			pass
-		elif halign == "r":
-			# Right-alighed
-			pos -= Vector2d(texture.text_extents.x_advance, 0)
-		elif valign == "c":
-			# Center alignment
-			pos -= Vector2d(texture.text_extents.x_advance / 2, 0)
-		else:
-			raise Exception(NotImplemented)
-
+		pos = TextMetrics.anchor_position(pos, texture.text_extents, anchor)
 		self.blit(texture, offset = pos, clip = True)
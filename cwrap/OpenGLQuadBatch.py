@@ -0,0 +1,134 @@
+import array
+import ctypes
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+# Collects textured quads on the CPU side and submits them with a single
+# vertex buffer upload per frame. Consecutive quads that share texture and
+# scissor state are drawn with one glDrawArrays call.
+class OpenGLQuadBatch(object):
+	_VERTEX_SHADER = """
+		attribute vec2 a_position;
+		attribute vec2 a_texcoord;
+		uniform vec4 u_projection;
+		varying vec2 v_texcoord;
+
+		void main() {
+			gl_Position = vec4(a_position * u_projection.xy + u_projection.zw, 0.0, 1.0);
+			v_texcoord = a_texcoord;
+		}
+	"""
+
+	_FRAGMENT_SHADER = """
+		#ifdef GL_ES
+		precision mediump float;
+		#endif
+		uniform sampler2D u_texture;
+		varying vec2 v_texcoord;
+
+		void main() {
+			gl_FragColor = texture2D(u_texture, v_texcoord);
+		}
+	"""
+
+	_FLOATS_PER_VERTEX = 4
+	_BYTES_PER_VERTEX = 4 * _FLOATS_PER_VERTEX
+
+	def __init__(self, dimensions, state):
+		self._dimensions = dimensions
+		self._state = state
+		self._program = None
+		self._projection = None
+		self._vbo = None
+		self._locations = None
+		self._vertices = array.array("f")
+		self._vertex_count = 0
+		self._batches = [ ]
+
+	@property
+	def quad_count(self):
+		return self._vertex_count // 6
+
+	def _initialize(self):
+		self._program = shaders.compileProgram(shaders.compileShader(self._VERTEX_SHADER, GL_VERTEX_SHADER), shaders.compileShader(self._FRAGMENT_SHADER, GL_FRAGMENT_SHADER))
+		self._locations = {
+			"a_position":	glGetAttribLocation(self._program, "a_position"),
+			"a_texcoord":	glGetAttribLocation(self._program, "a_texcoord"),
+			"u_projection":	glGetUniformLocation(self._program, "u_projection"),
+			"u_texture":	glGetUniformLocation(self._program, "u_texture"),
+		}
+		self._vbo = self._state.call(glGenBuffers, 1)
+
+		# There is only a single vertex layout, so the attribute pointers are
+		# set up once and stay valid when the buffer storage is replaced.
+		self._state.use_program(self._program)
+		self._state.bind_array_buffer(self._vbo)
+		self._state.call(glUniform1i, self._locations["u_texture"], 0)
+		self._state.call(glEnableVertexAttribArray, self._locations["a_position"])
+		self._state.call(glVertexAttribPointer, self._locations["a_position"], 2, GL_FLOAT, GL_FALSE, self._BYTES_PER_VERTEX, ctypes.c_void_p(0))
+		self._state.call(glEnableVertexAttribArray, self._locations["a_texcoord"])
+		self._state.call(glVertexAttribPointer, self._locations["a_texcoord"], 2, GL_FLOAT, GL_FALSE, self._BYTES_PER_VERTEX, ctypes.c_void_p(8))
+		self.set_projection(self._dimensions)
+
+	def set_projection(self, dimensions, origin = None, flip_y = False):
+		# Maps pixel coordinates (origin top left, y growing downwards) into
+		# normalized device coordinates. Flipped for rendering into textures,
+		# where the first row is at the bottom.
+		if self._program is None:
+			self._initialize()
+		if origin is None:
+			(x0, y0) = (0, 0)
+		else:
+			(x0, y0) = (origin.x, origin.y)
+		(sx, sy) = (2 / dimensions.x, 2 / dimensions.y)
+		if flip_y:
+			projection = (sx, sy, -1 - (x0 * sx), -1 - (y0 * sy))
+		else:
+			projection = (sx, -sy, -1 - (x0 * sx), 1 + (y0 * sy))
+		if projection != self._projection:
+			self._state.use_program(self._program)
+			self._state.call(glUniform4f, self._locations["u_projection"], *projection)
+			self._projection = projection
+
+	def add_quad(self, texid, scissor, corners, texcoords):
+		# Corners are given as top left, top right, bottom right, bottom left;
+		# texture coordinates as (min_u, min_v, max_u, max_v).
+		((x0, y0), (x1, y1), (x2, y2), (x3, y3)) = corners
+		(u0, v0, u1, v1) = texcoords
+		self._vertices.extend((
+			x0, y0, u0, v0,
+			x1, y1, u1, v0,
+			x2, y2, u1, v1,
+			x0, y0, u0, v0,
+			x2, y2, u1, v1,
+			x3, y3, u0, v1,
+		))
+
+		if (len(self._batches) > 0) and (self._batches[-1][0] == texid) and (self._batches[-1][1] == scissor):
+			self._batches[-1][3] += 6
+		else:
+			self._batches.append([ texid, scissor, self._vertex_count, 6 ])
+		self._vertex_count += 6
+
+	def flush(self):
+		if self._vertex_count == 0:
+			return
+		if self._program is None:
+			self._initialize()
+
+		self._state.use_program(self._program)
+		self._state.bind_array_buffer(self._vbo)
+		self._state.call(glBufferData, GL_ARRAY_BUFFER, self._vertex_count * self._BYTES_PER_VERTEX, self._vertices.tobytes(), GL_STREAM_DRAW)
+
+		for (texid, scissor, first, count) in self._batches:
+			self._state.bind_texture(texid)
+			self._state.set_scissor(scissor)
+			self._state.call(glDrawArrays, GL_TRIANGLES, first, count)
+
+		# Leave the scissor test disabled so that glClear and friends outside
+		# of the batch are not affected.
+		self._state.set_scissor(None)
+
+		del self._vertices[:]
+		self._vertex_count = 0
+		self._batches = [ ]
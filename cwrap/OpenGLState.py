@@ -0,0 +1,135 @@
+import collections
+from OpenGL.GL import *
+
+FrameCallStats = collections.namedtuple("FrameCallStats", [ "calls", "skipped" ])
+
+class OpenGLState(object):
+	# Shadows the pieces of GL state that the renderer changes frequently and
+	# drops calls that would not change anything. Every GL call issued by
+	# the cwrap backend is counted, so the per-frame call budget can be
+	# watched.
+	_UNKNOWN = object()
+
+	def __init__(self):
+		self._calls = 0
+		self._skipped = 0
+		self._last_frame = FrameCallStats(calls = 0, skipped = 0)
+		self.invalidate()
+
+	@property
+	def last_frame(self):
+		return self._last_frame
+
+	@property
+	def calls(self):
+		return self._calls
+
+	def invalidate(self):
+		# Call after GL state was changed behind the tracker's back.
+		self._texid = self._UNKNOWN
+		self._scissor_enabled = self._UNKNOWN
+		self._scissor_rect = self._UNKNOWN
+		self._blend_func = self._UNKNOWN
+		self._program = self._UNKNOWN
+		self._array_buffer = self._UNKNOWN
+		self._viewport = self._UNKNOWN
+		self._identity_matrices = set()
+
+	def call(self, function, *args):
+		# GL calls whose state is not shadowed go through here so that they
+		# are counted as well.
+		self._calls += 1
+		return function(*args)
+
+	def end_frame(self):
+		self._last_frame = FrameCallStats(calls = self._calls, skipped = self._skipped)
+		self._calls = 0
+		self._skipped = 0
+		return self._last_frame
+
+	def bind_texture(self, texid):
+		if self._texid == texid:
+			self._skipped += 1
+			return
+		glBindTexture(GL_TEXTURE_2D, texid)
+		self._texid = texid
+		self._calls += 1
+
+	def textures_deleted(self, texids):
+		if self._texid in texids:
+			self._texid = self._UNKNOWN
+
+	def set_scissor(self, scissor):
+		# None disables the scissor test, otherwise (x, y, width, height) in
+		# window coordinates.
+		if scissor is None:
+			if self._scissor_enabled is False:
+				self._skipped += 1
+				return
+			glDisable(GL_SCISSOR_TEST)
+			self._scissor_enabled = False
+			self._calls += 1
+		else:
+			if self._scissor_enabled is not True:
+				glEnable(GL_SCISSOR_TEST)
+				self._scissor_enabled = True
+				self._calls += 1
+			if self._scissor_rect == scissor:
+				self._skipped += 1
+				return
+			glScissor(*scissor)
+			self._scissor_rect = scissor
+			self._calls += 1
+
+	def blend_func(self, sfactor, dfactor):
+		if self._blend_func == (sfactor, dfactor):
+			self._skipped += 1
+			return
+		glBlendFunc(sfactor, dfactor)
+		self._blend_func = (sfactor, dfactor)
+		self._calls += 1
+
+	def use_program(self, program):
+		if self._program == program:
+			self._skipped += 1
+			return
+		glUseProgram(program)
+		self._program = program
+		self._calls += 1
+
+	def bind_array_buffer(self, vbo):
+		if self._array_buffer == vbo:
+			self._skipped += 1
+			return
+		glBindBuffer(GL_ARRAY_BUFFER, vbo)
+		self._array_buffer = vbo
+		self._calls += 1
+
+	def viewport(self, x, y, width, height):
+		if self._viewport == (x, y, width, height):
+			self._skipped += 1
+			return
+		glViewport(x, y, width, height)
+		self._viewport = (x, y, width, height)
+		self._calls += 1
+
+	@property
+	def current_viewport(self):
+		return None if (self._viewport is self._UNKNOWN) else self._viewport
+
+	def load_identity(self, matrix_mode):
+		# Fixed function matrices are only used for legacy drawing code; they
+		# are reset once and left alone afterwards.
+		if matrix_mode in self._identity_matrices:
+			self._skipped += 1
+			return
+		glMatrixMode(matrix_mode)
+		glLoadIdentity()
+		self._identity_matrices.add(matrix_mode)
+		self._calls += 2
+
+	def matrix_modified(self, matrix_mode):
+		self._identity_matrices.discard(matrix_mode)
+
+	def __str__(self):
+		return "GLState<%d calls, %d skipped in last frame>" % (self._last_frame.calls, self._last_frame.skipped)
@@ -0,0 +1,72 @@
+import ctypes
+import collections
+from OpenGL.GL import *
+
+class OpenGLTexturePool(object):
+	def __init__(self, state, grow_count = 4, max_free_per_bucket = 16, use_pbo = False):
+		self._state = state
+		self._grow_count = grow_count
+		self._max_free_per_bucket = max_free_per_bucket
+		self._use_pbo = use_pbo
+		self._pbo = None
+		self._free = collections.defaultdict(list)
+		self._allocated = 0
+		self._reused = 0
+
+	@property
+	def allocated(self):
+		return self._allocated
+
+	@property
+	def reused(self):
+		return self._reused
+
+	def preallocate(self, width, height, count):
+		# Textures are allocated with undefined content once and are only
+		# ever refilled using glTexSubImage2D afterwards.
+		texids = self._state.call(glGenTextures, count)
+		if count == 1:
+			texids = [ texids ]
+		for texid in texids:
+			self._state.bind_texture(int(texid))
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+			self._state.call(glTexParameterf, GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+			self._state.call(glTexImage2D, GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+			self._free[(width, height)].append(int(texid))
+		self._allocated += count
+
+	def acquire(self, width, height):
+		bucket = self._free[(width, height)]
+		if len(bucket) == 0:
+			self.preallocate(width, height, self._grow_count)
+		else:
+			self._reused += 1
+		return bucket.pop()
+
+	def upload(self, texid, width, height, rgba_data):
+		self._state.bind_texture(texid)
+		if not self._use_pbo:
+			self._state.call(glTexSubImage2D, GL_TEXTURE_2D, 0, 0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE, rgba_data)
+		else:
+			# Orphan the pixel buffer's previous storage so that the driver
+			# does not have to wait for a pending transfer from it.
+			if self._pbo is None:
+				self._pbo = self._state.call(glGenBuffers, 1)
+			self._state.call(glBindBuffer, GL_PIXEL_UNPACK_BUFFER, self._pbo)
+			self._state.call(glBufferData, GL_PIXEL_UNPACK_BUFFER, 4 * width * height, rgba_data, GL_STREAM_DRAW)
+			self._state.call(glTexSubImage2D, GL_TEXTURE_2D, 0, 0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+			self._state.call(glBindBuffer, GL_PIXEL_UNPACK_BUFFER, 0)
+
+	def release(self, texid, width, height):
+		bucket = self._free[(width, height)]
+		if len(bucket) < self._max_free_per_bucket:
+			bucket.append(texid)
+		else:
+			self._state.call(glDeleteTextures, [ texid ])
+			self._state.textures_deleted([ texid ])
+			self._allocated -= 1
+
+	def __str__(self):
+		return "TexturePool<%d allocated, %d free, %d reused>" % (self._allocated, sum(len(bucket) for bucket in self._free.values()), self._reused)
@@ -0,0 +1,74 @@
+import cairo
+import threading
+import collections
+from geo import Vector2d, Box2d
+from .ObjectLRUCache import ObjectLRUCache
+
+TextExtents = collections.namedtuple("TextExtents", [ "x_bearing", "y_bearing", "width", "height", "x_advance", "y_advance" ])
+
+class TextMetrics(object):
+	# Backend independent text measurement; both contexts render text through
+	# Cairo's toy font API, so extents measured here match what they draw.
+	_measure_cctx = None
+	_measure_font = None
+	_extents_cache = None
+	_lock = threading.Lock()
+
+	@staticmethod
+	def anchor_position(pos, text_extents, anchor):
+		# Anchor is one of top/center/bottom - left/center/right combinations
+		assert(len(anchor) == 2)
+		(valign, halign) = anchor
+		assert(valign in "tcb")
+		assert(halign in "lcr")
+
+		if valign == "b":
+			# Baseline, Cairo default
+			pass
+		elif valign == "t":
+			# Top left
+			pos -= Vector2d(0, text_extents.y_bearing)
+		elif valign == "c":
+			# Center left
+			pos -= Vector2d(0, text_extents.y_bearing / 2)
+		else:
+			raise Exception(NotImplemented)
+
+		if halign == "l":
+			# Left-aligned, Cairo default
+			pass
+		elif halign == "r":
+			# Right-alighed
+			pos -= Vector2d(text_extents.x_advance, 0)
+		elif halign == "c":
+			# Center alignment
+			pos -= Vector2d(text_extents.x_advance / 2, 0)
+		else:
+			raise Exception(NotImplemented)
+		return pos
+
+	@classmethod
+	def _measure(cls, fontname, fontsize, text):
+		if cls._measure_cctx is None:
+			cls._measure_cctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+		if cls._measure_font != (fontname, fontsize):
+			cls._measure_cctx.select_font_face(fontname, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+			cls._measure_cctx.set_font_size(fontsize)
+			cls._measure_font = (fontname, fontsize)
+		return TextExtents(*cls._measure_cctx.text_extents(text))
+
+	@classmethod
+	def text_extents(cls, fontname, fontsize, text):
+		with cls._lock:
+			if cls._extents_cache is None:
+				cls._extents_cache = ObjectLRUCache(cls._measure, max_items = 1024)
+			return cls._extents_cache[(fontname, fontsize, text)]
+
+	@classmethod
+	def text_box(cls, fontname, fontsize, pos, text, anchor, margin = 2):
+		# Screen area that is inked when drawing the text, including some
+		# margin for antialiasing and pixel snapping.
+		text_extents = cls.text_extents(fontname, fontsize, text)
+		pos = cls.anchor_position(pos, text_extents, anchor)
+		base = Vector2d(pos.x + text_extents.x_bearing - margin, pos.y + text_extents.y_bearing - margin)
+		return Box2d(base = base, dimensions = Vector2d(text_extents.width + 2 * margin, text_extents.height + 2 * margin))
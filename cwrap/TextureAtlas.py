@@ -0,0 +1,107 @@
+import math
+import cairo
+import collections
+
+AtlasEntry = collections.namedtuple("AtlasEntry", [ "page", "x", "y", "width", "height", "uv" ])
+AtlasPage = collections.namedtuple("AtlasPage", [ "width", "height", "data" ])
+
+class TextureAtlas(object):
+	def __init__(self, pages, entries, backing = None):
+		# Pages hold upload-ready RGBA data; backing keeps whatever owns that
+		# memory (Cairo surfaces or a memory map) alive.
+		self._pages = pages
+		self._entries = entries
+		self._backing = backing
+
+	@property
+	def pages(self):
+		return self._pages
+
+	@property
+	def entries(self):
+		return self._entries
+
+	@property
+	def memory_bytes(self):
+		return sum(4 * page.width * page.height for page in self._pages)
+
+	@staticmethod
+	def _next_pwr2(value):
+		for i in range(16):
+			if (2 ** i) >= value:
+				return 2 ** i
+
+	@classmethod
+	def _cell_dimension(cls, surface, dimension, max_size):
+		# Store images at their displayed size (which undoes the power-of-two
+		# stretching of texture exports) but never upscale the source image.
+		width = min(math.ceil(dimension.x), surface.get_width(), max_size)
+		height = min(math.ceil(dimension.y), surface.get_height(), max_size)
+		return (max(width, 1), max(height, 1))
+
+	@classmethod
+	def _pack(cls, cells, page_size, padding):
+		# Simple shelf packer: tallest cells first, each page is filled with
+		# horizontal shelves from top to bottom.
+		placements = { }
+		pages = [ ]
+		for (key, (width, height)) in sorted(cells.items(), key = lambda item: (-item[1][1], -item[1][0])):
+			(padded_width, padded_height) = (width + 2 * padding, height + 2 * padding)
+			placed = False
+			for (pageno, shelves) in enumerate(pages):
+				for shelf in shelves:
+					if (padded_height <= shelf[1]) and (shelf[2] + padded_width <= page_size):
+						placements[key] = (pageno, shelf[2] + padding, shelf[0] + padding)
+						shelf[2] += padded_width
+						placed = True
+						break
+				if not placed:
+					shelf_y = 0 if (len(shelves) == 0) else (shelves[-1][0] + shelves[-1][1])
+					if shelf_y + padded_height <= page_size:
+						shelves.append([ shelf_y, padded_height, padded_width ])
+						placements[key] = (pageno, padding, shelf_y + padding)
+						placed = True
+				if placed:
+					break
+			if not placed:
+				pages.append([ [ 0, padded_height, padded_width ] ])
+				placements[key] = (len(pages) - 1, padding, padding)
+		page_heights = [ shelves[-1][0] + shelves[-1][1] for shelves in pages ]
+		return (placements, page_heights)
+
+	@classmethod
+	def build(cls, images, page_size = 2048, padding = 1):
+		# images is a list of (key, cairo surface, displayed dimension) tuples
+		max_size = page_size - 2 * padding
+		cells = { key: cls._cell_dimension(surface, dimension, max_size) for (key, surface, dimension) in images }
+		(placements, page_heights) = cls._pack(cells, page_size, padding)
+
+		pages = [ cairo.ImageSurface(cairo.FORMAT_ARGB32, page_size, cls._next_pwr2(page_height)) for page_height in page_heights ]
+		contexts = [ cairo.Context(page) for page in pages ]
+		entries = { }
+		for (key, surface, dimension) in images:
+			(pageno, x, y) = placements[key]
+			(width, height) = cells[key]
+			cctx = contexts[pageno]
+			cctx.save()
+			# Padding replicates the edge pixels, like GL_CLAMP would
+			cctx.rectangle(x - padding, y - padding, width + 2 * padding, height + 2 * padding)
+			cctx.clip()
+			cctx.translate(x, y)
+			cctx.scale(width / surface.get_width(), height / surface.get_height())
+			cctx.set_source_surface(surface)
+			cctx.get_source().set_extend(cairo.EXTEND_PAD)
+			cctx.set_operator(cairo.OPERATOR_SOURCE)
+			cctx.paint()
+			cctx.restore()
+
+			page = pages[pageno]
+			uv = (x / page.get_width(), y / page.get_height(), (x + width) / page.get_width(), (y + height) / page.get_height())
+			entries[key] = AtlasEntry(page = pageno, x = x, y = y, width = width, height = height, uv = uv)
+		for page in pages:
+			page.flush()
+		atlas_pages = [ AtlasPage(width = page.get_width(), height = page.get_height(), data = page.get_data()) for page in pages ]
+		return cls(pages = atlas_pages, entries = entries, backing = pages)
+
+	def __str__(self):
+		return "TextureAtlas<%d entries, %d pages, %.1f MiB>" % (len(self._entries), len(self._pages), self.memory_bytes / 1024 / 1024)
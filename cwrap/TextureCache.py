@@ -0,0 +1,96 @@
+import os
+import mmap
+import json
+import struct
+from .TextureAtlas import TextureAtlas, AtlasEntry, AtlasPage
+
+# Binary cache of fully packed, upload-ready atlas pages. Layout:
+#   header (magic, version, metadata length), JSON metadata, padding,
+#   then the raw RGBA page data, each page starting on an mmap page boundary
+# The metadata records the signature of all source images; if any of them
+# changed (or the set of images is different) the cache is rebuilt.
+class TextureCache(object):
+	_MAGIC = b"PGTC"
+	_VERSION = 1
+	_HEADER = struct.Struct("<4sHHI")
+
+	@classmethod
+	def signature(cls, images, page_size, layouts = None):
+		# images is a list of (filename, displayed dimension) tuples; layouts
+		# describes how images were combined into atlas entries, if at all.
+		sources = [ ]
+		for (filename, dimension) in images:
+			stat = os.stat(filename)
+			sources.append([ os.path.basename(filename), stat.st_mtime_ns, stat.st_size, dimension.x, dimension.y ])
+		return { "page_size": page_size, "sources": sources, "layouts": layouts }
+
+	@staticmethod
+	def _align(offset):
+		return (offset + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+
+	@classmethod
+	def write(cls, filename, signature, atlas):
+		metadata = {
+			"signature":	signature,
+			"pages":		[ ],
+			"entries":		[ [ key, entry.page, entry.x, entry.y, entry.width, entry.height, list(entry.uv) ] for (key, entry) in atlas.entries.items() ],
+		}
+		for page in atlas.pages:
+			metadata["pages"].append([ page.width, page.height ])
+		encoded_metadata = json.dumps(metadata).encode("utf-8")
+
+		tmp_filename = filename + ".tmp"
+		with open(tmp_filename, "wb") as f:
+			f.write(cls._HEADER.pack(cls._MAGIC, cls._VERSION, 0, len(encoded_metadata)))
+			f.write(encoded_metadata)
+			for page in atlas.pages:
+				offset = cls._align(f.tell())
+				f.write(bytes(offset - f.tell()))
+				f.write(page.data)
+		os.rename(tmp_filename, filename)
+
+	@classmethod
+	def load(cls, filename, signature):
+		# Returns None for a missing, outdated, truncated or otherwise corrupt
+		# cache so that the caller rebuilds the atlas and rewrites it.
+		try:
+			f = open(filename, "rb")
+		except FileNotFoundError:
+			return None
+		with f:
+			file_size = os.fstat(f.fileno()).st_size
+			header = f.read(cls._HEADER.size)
+			if len(header) != cls._HEADER.size:
+				return None
+			(magic, version, reserved, metadata_length) = cls._HEADER.unpack(header)
+			if (magic != cls._MAGIC) or (version != cls._VERSION):
+				return None
+			if cls._HEADER.size + metadata_length > file_size:
+				return None
+			try:
+				metadata = json.loads(f.read(metadata_length).decode("utf-8"))
+				if metadata["signature"] != signature:
+					return None
+				page_sizes = [ (int(width), int(height)) for (width, height) in metadata["pages"] ]
+				entries = { key: AtlasEntry(page = page, x = x, y = y, width = width, height = height, uv = tuple(uv)) for (key, page, x, y, width, height, uv) in metadata["entries"] }
+			except (ValueError, KeyError, TypeError):
+				return None
+
+			# All pages have to be present in full before anything is mapped
+			offset = cls._HEADER.size + metadata_length
+			page_offsets = [ ]
+			for (width, height) in page_sizes:
+				offset = cls._align(offset)
+				page_offsets.append(offset)
+				offset += 4 * width * height
+			if offset > file_size:
+				return None
+
+			# Copy-on-write mapping: pixel data is read straight from the page
+			# cache while still yielding a writable buffer, which some
+			# PyOpenGL versions insist on.
+			mapping = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_COPY)
+
+		view = memoryview(mapping)
+		pages = [ AtlasPage(width = width, height = height, data = view[offset : offset + (4 * width * height)]) for ((width, height), offset) in zip(page_sizes, page_offsets) ]
+		return TextureAtlas(pages = pages, entries = entries, backing = mapping)
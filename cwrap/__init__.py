@@ -1,2 +1,6 @@
-from .CairoContext import CairoContext, FontExtents, TextExtents
+from .ObjectLRUCache import ObjectLRUCache, CacheStats
+from .CairoContext import CairoContext, FontExtents
+from .CairoSpriteCache import CairoSpriteCache
+from .CairoTextCache import CairoTextCache
+from .TextMetrics import TextMetrics, TextExtents
 from .OpenGLContext import OpenGLContext
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+#
+#	Sends synthetic instrument data over UDP, standing in for the simulator
+#	when testing the network input of render.py (--listen).
+#
+
+import sys
+import json
+import math
+import time
+import random
+import socket
+from FriendlyArgumentParser import FriendlyArgumentParser
+from InstrumentCodec import InstrumentCodec
+
+parser = FriendlyArgumentParser()
+parser.add_argument("--rate", metavar = "hz", type = float, default = 50, help = "Packets sent per second. Defaults to %(default).0f.")
+parser.add_argument("--burst", metavar = "count", type = int, default = 1, help = "Send this many consecutive samples back-to-back every burst interval, emulating a bursty network. Defaults to %(default)d.")
+parser.add_argument("--loss", metavar = "percent", type = float, default = 0, help = "Randomly drop this percentage of packets. Defaults to %(default).0f.")
+parser.add_argument("--reorder", metavar = "percent", type = float, default = 0, help = "Randomly swap this percentage of packets with their successor. Defaults to %(default).0f.")
+parser.add_argument("--format", choices = [ "json", "binary" ], default = "json", help = "Wire format. JSON packets only carry the values that change, binary packets always carry all instrument data. Defaults to %(default)s.")
+parser.add_argument("-n", "--count", metavar = "packets", type = int, default = 0, help = "Stop after this many packets; 0 sends until interrupted. Defaults to %(default)d.")
+parser.add_argument("address", metavar = "host:port", help = "Address render.py is listening on.")
+args = parser.parse_args(sys.argv[1:])
+
+def sample(index, t):
+	packet = {
+		"seq": index,
+		"pos": {
+			"heading_deg":		(128 + 5 * t) % 360,
+			"altitude_ft":		12345 + 200 * math.sin(t / 10),
+			"pitch_angle_deg":	10 * math.sin(t / 3),
+			"roll_angle_deg":	30 * math.sin(t / 4),
+			"tas":				125 + 10 * math.sin(t / 8),
+			"ias":				120 + 10 * math.sin(t / 8),
+		},
+		"ap": {
+			"hdgbug_deg":		(90 + 3 * t) % 360,
+		},
+		"vor1": {
+			"obs":				72,
+			"deviation_deg":	3 * math.sin(t / 5),
+		},
+	}
+	if index % 50 == 0:
+		# Slowly changing data is sent less often
+		packet["freq"] = {
+			"com1": { "active": 118.8, "stby": 118 + (index // 50 % 100) * 0.025 },
+		}
+		packet["xpdr"] = { "squawk": 7000 }
+	return packet
+
+state = {
+	"freq": {
+		"com1": { "active": 118.8, "stby": 118.0 },
+		"com2": { "active": 121.5, "stby": 122.8 },
+		"nav1": { "active": 109.9, "stby": 110.9 },
+		"nav2": { "active": 113.25, "stby": 112.95 },
+	},
+	"ias_bars": {
+		"white":			[0, 100],
+		"red":				[0, 60],
+		"green":			[60, 150],
+		"yellow":			[150, 220],
+		"redwhite":			[220, 9999],
+	},
+}
+
+def encode(packet):
+	if args.format == "json":
+		return json.dumps(packet).encode("utf-8")
+	sequence = packet.pop("seq")
+	for (key, value) in packet.items():
+		if key == "freq":
+			for (radio, frequencies) in value.items():
+				state["freq"][radio].update(frequencies)
+		else:
+			state[key] = value
+	return InstrumentCodec.encode(state, sequence)
+
+(host, _, port) = args.address.rpartition(":")
+target = (host or "127.0.0.1", int(port))
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+interval = args.burst / args.rate
+t_start = time.time()
+index = 0
+held_back = None
+try:
+	while (args.count == 0) or (index < args.count):
+		for i in range(args.burst):
+			packet = encode(sample(index, time.time() - t_start))
+			index += 1
+			if random.random() * 100 < args.loss:
+				continue
+			if (held_back is None) and (random.random() * 100 < args.reorder):
+				held_back = packet
+				continue
+			sock.sendto(packet, target)
+			if held_back is not None:
+				sock.sendto(held_back, target)
+				held_back = None
+		deadline = t_start + (index / args.burst) * interval
+		time.sleep(max(0, deadline - time.time()))
+except KeyboardInterrupt:
+	pass
+print("%d packets sent" % (index))
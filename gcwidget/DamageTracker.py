@@ -0,0 +1,46 @@
+from .Tools import BoxTools
+
+class DamageTracker(object):
+	# Remembers which input values and screen area every drawn item had when
+	# damage was last computed. Items whose inputs changed damage both their
+	# old and their new area.
+	def __init__(self, screen_box):
+		self._screen_box = screen_box
+		self._state = { }
+		self._full_redraw = True
+
+	def invalidate(self):
+		self._full_redraw = True
+
+	def update(self, items):
+		# Items are (key, input values, bounds) tuples; bounds is None when
+		# the item is currently not drawn at all.
+		damage = [ ]
+		state = { }
+		for (key, values, bounds) in items:
+			state[key] = (values, bounds)
+			previous = self._state.get(key)
+			if previous is not None:
+				(previous_values, previous_bounds) = previous
+				if previous_values == values:
+					continue
+				if previous_bounds is not None:
+					damage.append(previous_bounds)
+			if bounds is not None:
+				damage.append(bounds)
+		for key in self._state.keys() - state.keys():
+			previous_bounds = self._state[key][1]
+			if previous_bounds is not None:
+				damage.append(previous_bounds)
+		self._state = state
+
+		if self._full_redraw:
+			self._full_redraw = False
+			return [ self._screen_box ]
+
+		clipped = [ ]
+		for box in damage:
+			box = BoxTools.intersection(BoxTools.snap(box), self._screen_box)
+			if box is not None:
+				clipped.append(box)
+		return BoxTools.merge(clipped)
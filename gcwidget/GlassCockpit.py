@@ -1,13 +1,19 @@
+import sys
 import json
+import time
 import collections
 import cwrap
-import math
 import datetime
 from geo import Vector2d, Box2d
-from .Tools import AngleTools
+from .Tools import AngleTools, BoxTools
 from .Color import Color
+from .DamageTracker import DamageTracker
+from .InstrumentState import InstrumentState
 
 _GCElement = collections.namedtuple("GCElement", [ "name", "offset", "dimensions", "clip", "center_of_rotation", "cctx" ])
+_GCFont = collections.namedtuple("GCFont", [ "name", "size", "color" ])
+_GCTextElement = collections.namedtuple("GCTextElement", [ "poi", "font", "anchor", "inputs", "format" ])
+_GCGroup = collections.namedtuple("GCGroup", [ "name", "elements", "bounds", "inputs", "threshold" ])
 
 class GlassCockpit(object):
 	_COLORS = {
@@ -26,19 +32,80 @@ class GlassCockpit(object):
 		"crs-text":				Color.from_rgb_int(0xd405d4),
 	}
 
-	def __init__(self, config, context_class, img_prefix = ""):
+	# InstrumentState attributes that the appearance of each layer depends on.
+	# Layers not listed here are static.
+	_ELEMENT_INPUTS = {
+		"ahoriz-skygnd":		("pitch_angle_deg", "roll_angle_deg"),
+		"ahoriz-degs":			("pitch_angle_deg", "roll_angle_deg"),
+		"compass-rot":			("heading_deg", ),
+		"compass-obs":			("heading_deg", "obs_deg"),
+		"compass-obs-center":	("heading_deg", "obs_deg", "deviation_deg"),
+		"hdgbug":				("heading_deg", "hdgbug_deg"),
+		"speedindicator":		("ias", ),
+		"speedindicator-tics":	("ias", ),
+	}
+
+	# Layers of one instrument that are drawn into a cached render target
+	# together. Names ending in a dash match all layers with that prefix.
+	_GROUPS = [
+		("hsi",			("compass-rot", "compass-obs", "compass-obs-center", "hdgbug")),
+		("speedtape",	("speedindicator", "speedindicator-tics", "speedindicator-bar-")),
+	]
+
+	# A group is only redrawn once any of its inputs moved by more than this
+	# (in degrees or knots) since the cached image was rendered.
+	_GROUP_THRESHOLDS = {
+		"hsi":			0.1,
+		"speedtape":	0.05,
+	}
+
+	_TEXT_ELEMENTS = [
+		_GCTextElement(poi = "ias-text", font = _GCFont("Nimbus Sans L", 22, "ias_text"), anchor = "cr", inputs = ("ias", ), format = "%.0f"),
+
+		_GCTextElement(poi = "com1-act-freq", font = _GCFont("Nimbus Sans L", 20, "active_freq_text"), anchor = "bl", inputs = ("com1_active", ), format = "%.3f"),
+		_GCTextElement(poi = "com2-act-freq", font = _GCFont("Nimbus Sans L", 20, "active_freq_text"), anchor = "bl", inputs = ("com2_active", ), format = "%.3f"),
+		_GCTextElement(poi = "nav1-act-freq", font = _GCFont("Nimbus Sans L", 20, "active_freq_text"), anchor = "bl", inputs = ("nav1_active", ), format = "%.2f"),
+		_GCTextElement(poi = "nav2-act-freq", font = _GCFont("Nimbus Sans L", 20, "active_freq_text"), anchor = "bl", inputs = ("nav2_active", ), format = "%.2f"),
+
+		_GCTextElement(poi = "com1-stby-freq", font = _GCFont("Nimbus Sans L", 20, "standby_freq_text"), anchor = "bl", inputs = ("com1_stby", ), format = "%.3f"),
+		_GCTextElement(poi = "com2-stby-freq", font = _GCFont("Nimbus Sans L", 20, "standby_freq_text"), anchor = "bl", inputs = ("com2_stby", ), format = "%.3f"),
+		_GCTextElement(poi = "nav1-stby-freq", font = _GCFont("Nimbus Sans L", 20, "standby_freq_text"), anchor = "bl", inputs = ("nav1_stby", ), format = "%.2f"),
+		_GCTextElement(poi = "nav2-stby-freq", font = _GCFont("Nimbus Sans L", 20, "standby_freq_text"), anchor = "bl", inputs = ("nav2_stby", ), format = "%.2f"),
+
+		_GCTextElement(poi = "xpdr-squawk", font = _GCFont("Nimbus Sans L", 20, "standby_freq_text"), anchor = "bl", inputs = ("squawk", ), format = "%04d"),
+		_GCTextElement(poi = "time-utc", font = _GCFont("Nimbus Sans L", 20, "standby_freq_text"), anchor = "bl", inputs = ("utc", ), format = "%s"),
+
+		_GCTextElement(poi = "hdg-text", font = _GCFont("Nimbus Sans L", 22, "ias_text"), anchor = "cc", inputs = ("heading_deg", ), format = "%.0f°"),
+		_GCTextElement(poi = "hdgbug-text", font = _GCFont("Nimbus Sans L", 14, "hdgbug-text"), anchor = "bl", inputs = ("hdgbug_deg", ), format = "%.0f°"),
+		_GCTextElement(poi = "crs-text", font = _GCFont("Nimbus Sans L", 14, "crs-text"), anchor = "bl", inputs = ("obs_deg", ), format = "%.0f°"),
+	]
+
+	def __init__(self, config, context_class, img_prefix = "", flatten_static_layers = True, group_thresholds = None, profiler = None):
 		self._config = config
 		self._context_class = context_class
 		self._autoconfig = { }
-		self._data = { }
+		self._state = InstrumentState()
 		self._elements = [ ]
 		self._img_prefix = img_prefix
+		self._profiler = profiler
+		self._group_thresholds = self._GROUP_THRESHOLDS if (group_thresholds is None) else group_thresholds
+		self._group_snapshots = { }
+		self._group_targets = { }
 		self._load_elements("imgs/render/")
+		self._update_translations()
+		self._build_groups()
+		if flatten_static_layers:
+			self._flatten_static_layers()
+		self._damage = DamageTracker(Box2d(base = Vector2d(0, 0), dimensions = self.screen_dimension))
 
 	@property
 	def screen_dimension(self):
 		return self._config["screen_dimension"]
 
+	@property
+	def profiler(self):
+		return self._profiler
+
 	def _load_elements(self, basedir):
 		with open(basedir + "layers.json") as f:
 			data = json.loads(f.read())
@@ -66,21 +133,109 @@ class GlassCockpit(object):
 		self._autoconfig["speedindicator_pixel_per_kt"] = abs((self._pois["speedindicator-top"] - self._pois["speedindicator-bottom"]).y / 50)
 
 
+	def _determine_extent(self, element):
+		# Largest screen area the element can cover for any instrument data
+		if element.clip is not None:
+			return element.clip
+		extent = Box2d(base = element.offset, dimensions = element.dimensions)
+		if element.name == "compass-obs-center":
+			extent = BoxTools.grow(extent, 4 * self._autoconfig["pixel_per_deg_deviation"])
+		elif element.name == "speedindicator-tics":
+			extent = BoxTools.grow(extent, 10 * self._autoconfig["speedindicator_pixel_per_kt"])
+		if element.name in [ "ahoriz-skygnd", "ahoriz-degs", "compass-rot", "compass-obs", "compass-obs-center", "hdgbug" ]:
+			extent = BoxTools.rotation_extent(extent, element.center_of_rotation)
+		return extent
+
+	@staticmethod
+	def _is_group_member(element, members):
+		return any((element.name == member) or (member.endswith("-") and element.name.startswith(member)) for member in members)
+
+	def _build_groups(self):
+		screen_box = Box2d(base = Vector2d(0, 0), dimensions = self.screen_dimension)
+		for (name, members) in self._GROUPS:
+			threshold = self._group_thresholds.get(name)
+			if threshold is None:
+				continue
+			indices = [ index for (index, element) in enumerate(self._elements) if self._is_group_member(element, members) ]
+			if len(indices) == 0:
+				continue
+
+			# Static layers in between the members become part of the group,
+			# other moving layers would end up in the wrong z-order.
+			elements = self._elements[indices[0] : indices[-1] + 1]
+			if any((not self._is_group_member(element, members)) and (len(self._element_inputs(element)) > 0) for element in elements):
+				print("Not caching layer group %s, it is interleaved with other moving layers" % (name), file = sys.stderr)
+				continue
+
+			bounds = None
+			inputs = [ ]
+			for element in elements:
+				bounds = BoxTools.union(bounds, self._determine_extent(element))
+				inputs += [ path for path in self._element_inputs(element) if path not in inputs ]
+			bounds = BoxTools.intersection(BoxTools.snap(bounds), screen_box)
+			if bounds is None:
+				continue
+			group = _GCGroup(name = name, elements = elements, bounds = bounds, inputs = tuple(inputs), threshold = threshold)
+			self._elements[indices[0] : indices[-1] + 1] = [ group ]
+
+	def _flatten_run(self, run):
+		layers = [ ]
+		bounds = None
+		for element in run:
+			element_bounds = Box2d(base = element.offset, dimensions = element.dimensions)
+			if element.clip is not None:
+				element_bounds = BoxTools.intersection(element_bounds, element.clip)
+				if element_bounds is None:
+					continue
+			bounds = BoxTools.union(bounds, element_bounds)
+			layers.append(element)
+		if bounds is None:
+			return None
+
+		# Integral placement keeps the layers pixel aligned inside the
+		# flattened image.
+		bounds = BoxTools.snap(bounds)
+		layers = [ (element.cctx, element.offset - bounds.base, None if (element.clip is None) else Box2d(base = element.clip.base - bounds.base, dimensions = element.clip.dimensions)) for element in layers ]
+		cctx = self._context_class.flatten_layers(bounds.dimensions, layers)
+		name = "flattened:%s..%s" % (run[0].name, run[-1].name)
+		return _GCElement(name = name, offset = bounds.base, dimensions = bounds.dimensions, clip = None, center_of_rotation = bounds.base + (bounds.dimensions / 2), cctx = cctx)
+
+	def _flatten_static_layers(self):
+		# Consecutive layers that never move are merged into one image each,
+		# keeping the drawing order intact.
+		elements = [ ]
+		run = [ ]
+		for element in self._elements + [ None ]:
+			if (element is not None) and (len(self._element_inputs(element)) == 0):
+				run.append(element)
+				continue
+			if len(run) > 1:
+				flattened = self._flatten_run(run)
+				if flattened is not None:
+					elements.append(flattened)
+			else:
+				elements += run
+			run = [ ]
+			if element is not None:
+				elements.append(element)
+		self._elements = elements
+
 	def _speedindicator_tics_text(self, element, at_offset):
 		element.font_select("Nimbus Sans L", 14, fontcolor = self._COLORS["ias_text"])
-		center_speed = int(self._data["pos"]["ias"] // 10) * 10
-		speed_offset = center_speed - 30
+		speed_offset = self._state.ias_tens - 30
 		for i in range(8):
 			speed = speed_offset + (10 * i)
 			if speed < 0:
 				continue
-			translation = Vector2d(0, (self._data["pos"]["ias"] % 10) * self._autoconfig["speedindicator_pixel_per_kt"])
-			element.text((self._pois["speedindicator-top"] - at_offset) + (Vector2d(0, self._autoconfig["speedindicator_pixel_per_kt"]) * (10 * (6 - i))) + translation, str(speed), anchor = "cr")
+			element.text((self._pois["speedindicator-top"] - at_offset) + (Vector2d(0, self._autoconfig["speedindicator_pixel_per_kt"]) * (10 * (6 - i))) + self._speedtape_translation, str(speed), anchor = "cr")
 
 	def _determine_clipping_ias_bar(self, element, color):
-		min_shown_speed = self._data["pos"]["ias"] - 30
+		bar = self._state.ias_bars.get(color)
+		if bar is None:
+			return None
+		min_shown_speed = self._state.ias - 30
 		max_shown_speed = min_shown_speed + 60
-		(bar_show_min, bar_show_max) = self._data["ias_bars"][color]
+		(bar_show_min, bar_show_max) = bar
 
 		if (bar_show_min > max_shown_speed) or (bar_show_max < min_shown_speed):
 			# Don't render at all
@@ -102,26 +257,22 @@ class GlassCockpit(object):
 		clipped_callback = None
 		do_draw = True
 
+		state = self._state
 		if element.name in [ "ahoriz-skygnd", "ahoriz-degs" ]:
-			translation = Vector2d(0, self._autoconfig["pixel_per_deg_pitch"] * self._data["pos"]["pitch_angle_deg"])
-			rotation_rad = self._data["pos"]["roll_angle_deg"] / 180 * math.pi
+			translation = self._pitch_translation
+			rotation_rad = state.roll_rad
 		elif element.name == "compass-rot":
-			rotation_rad = -self._data["pos"]["heading_deg"] / 180 * math.pi
+			rotation_rad = state.compass_rad
 		elif element.name in [ "compass-obs", "compass-obs-center" ]:
-			rotation_rad = (self._data["vor1"]["obs"] - self._data["pos"]["heading_deg"]) / 180 * math.pi
+			rotation_rad = state.obs_rad
 			if element.name == "compass-obs-center":
-				deviation_deg = self._data["vor1"]["deviation_deg"]
-				if deviation_deg < -4:
-					deviation_deg = -4
-				elif deviation_deg > 4:
-					deviation_deg = 4
-				translation = Vector2d(deviation_deg * self._autoconfig["pixel_per_deg_deviation"], 0)
+				translation = self._deviation_translation
 		elif element.name == "hdgbug":
-			rotation_rad = (self._data["ap"]["hdgbug_deg"] - self._data["pos"]["heading_deg"]) / 180 * math.pi
+			rotation_rad = state.hdgbug_rad
 		elif element.name == "speedindicator":
 			clipped_callback = self._speedindicator_tics_text
 		elif element.name == "speedindicator-tics":
-			translation = Vector2d(0, (self._data["pos"]["ias"] % 10) * self._autoconfig["speedindicator_pixel_per_kt"])
+			translation = self._speedtape_translation
 		elif element.name.startswith("speedindicator-bar-"):
 			color = element.name[19:]
 			clip = self._determine_clipping_ias_bar(element, color)
@@ -130,49 +281,192 @@ class GlassCockpit(object):
 		return (clip, translation, rotation_rad, clipped_callback, do_draw)
 
 	def feed_data(self, data):
-		self._data = data
+		# Instrument data is copied, changing the dict afterwards has no
+		# effect until it is fed again.
+		self._state.update(data)
+		self._update_translations()
 
-	def _render_textelements(self, screen):
-		screen.font_select("Nimbus Sans L", 22, fontcolor = self._COLORS["ias_text"])
-		screen.text(self._pois["ias-text"], "%.0f" % ((self._data["pos"]["ias"])), anchor = "cr")
+	def _update_translations(self):
+		state = self._state
+		self._pitch_translation = Vector2d(0, self._autoconfig["pixel_per_deg_pitch"] * state.pitch_angle_deg)
+		self._deviation_translation = Vector2d(state.deviation_clamped_deg * self._autoconfig["pixel_per_deg_deviation"], 0)
+		self._speedtape_translation = Vector2d(0, state.ias_fraction * self._autoconfig["speedindicator_pixel_per_kt"])
 
-		screen.font_select("Nimbus Sans L", 20, fontcolor = self._COLORS["active_freq_text"])
-		screen.text(self._pois["com1-act-freq"], "%.3f" % ((self._data["freq"]["com1"]["active"])), anchor = "bl")
-		screen.text(self._pois["com2-act-freq"], "%.3f" % ((self._data["freq"]["com2"]["active"])), anchor = "bl")
-		screen.text(self._pois["nav1-act-freq"], "%.2f" % ((self._data["freq"]["nav1"]["active"])), anchor = "bl")
-		screen.text(self._pois["nav2-act-freq"], "%.2f" % ((self._data["freq"]["nav2"]["active"])), anchor = "bl")
+	@staticmethod
+	def _utc_time_text():
+		return datetime.datetime.utcnow().strftime("%H:%M:%S")
 
-		screen.font_select("Nimbus Sans L", 20, fontcolor =  self._COLORS["standby_freq_text"])
-		screen.text(self._pois["com1-stby-freq"], "%.3f" % ((self._data["freq"]["com1"]["stby"])), anchor = "bl")
-		screen.text(self._pois["com2-stby-freq"], "%.3f" % ((self._data["freq"]["com2"]["stby"])), anchor = "bl")
-		screen.text(self._pois["nav1-stby-freq"], "%.2f" % ((self._data["freq"]["nav1"]["stby"])), anchor = "bl")
-		screen.text(self._pois["nav2-stby-freq"], "%.2f" % ((self._data["freq"]["nav2"]["stby"])), anchor = "bl")
+	def _input_value(self, name):
+		if name == "utc":
+			utc = self._state.utc
+			return self._utc_time_text() if (utc is None) else utc
+		return getattr(self._state, name)
 
-		screen.text(self._pois["xpdr-squawk"], "%04d" % (self._data["xpdr"]["squawk"]), anchor = "bl")
-		screen.text(self._pois["time-utc"], datetime.datetime.utcnow().strftime("%H:%M:%S"), anchor = "bl")
+	def _element_inputs(self, element):
+		if isinstance(element, _GCGroup):
+			return element.inputs
+		if element.name.startswith("speedindicator-bar-"):
+			return ("ias", "ias_bars")
+		return self._ELEMENT_INPUTS.get(element.name, ())
 
-		screen.font_select("Nimbus Sans L", 22, fontcolor = self._COLORS["ias_text"])
-		screen.text(self._pois["hdg-text"], "%.0f°" % ((self._data["pos"]["heading_deg"])), anchor = "cc")
+	def _element_bounds(self, element, renderopts):
+		(clip, translation, rotation_rad, clipped_callback, do_draw) = renderopts
+		if not do_draw:
+			return None
+		offset = element.offset
+		if translation is not None:
+			offset += translation
+		bounds = Box2d(base = offset, dimensions = element.dimensions)
+		if rotation_rad is not None:
+			bounds = BoxTools.rotated_bounds(bounds, element.center_of_rotation, rotation_rad)
+		# One pixel margin for antialiased edges
+		bounds = BoxTools.grow(bounds, 1)
+		if clip is not None:
+			bounds = BoxTools.intersection(bounds, clip)
+		return bounds
+
+	def _text_of(self, textelement):
+		return textelement.format % tuple(self._input_value(path) for path in textelement.inputs)
+
+	def _text_bounds(self, textelement, text):
+		return cwrap.TextMetrics.text_box(textelement.font.name, textelement.font.size, self._pois[textelement.poi], text, textelement.anchor)
 
-		screen.font_select("Nimbus Sans L", 14, fontcolor = self._COLORS["hdgbug-text"])
-		screen.text(self._pois["hdgbug-text"], "%.0f°" % ((self._data["ap"]["hdgbug_deg"])), anchor = "bl")
+	@staticmethod
+	def _in_region(bounds, region):
+		if region is None:
+			return True
+		if bounds is None:
+			return False
+		return any(BoxTools.intersects(bounds, box) for box in region)
 
-		screen.font_select("Nimbus Sans L", 14, fontcolor = self._COLORS["crs-text"])
-		screen.text(self._pois["crs-text"], "%.0f°" % ((self._data["vor1"]["obs"])), anchor = "bl")
+	def _group_snapshot(self, group):
+		# Input values the group's cached image shows. They are only advanced
+		# to the current values once any of them moved beyond the threshold.
+		values = tuple(self._input_value(path) for path in group.inputs)
+		snapshot = self._group_snapshots.get(group.name)
+		if snapshot is not None:
+			for (old, new) in zip(snapshot, values):
+				if isinstance(new, (int, float)) and isinstance(old, (int, float)):
+					if abs(new - old) > group.threshold:
+						break
+				elif new != old:
+					break
+			else:
+				return snapshot
+		self._group_snapshots[group.name] = values
+		return values
+
+	def invalidate(self):
+		self._damage.invalidate()
 
-	def render(self, screen):
+	def update_damage(self):
+		# Returns the list of screen areas that changed since the last call. The
+		# first call (and the first one after invalidate()) covers the whole
+		# screen.
+		items = [ ]
+		for (index, element) in enumerate(self._elements):
+			if isinstance(element, _GCGroup):
+				items.append((index, self._group_snapshot(element), element.bounds))
+				continue
+			values = tuple(self._input_value(path) for path in self._element_inputs(element))
+			if len(values) == 0:
+				items.append((index, values, None))
+			else:
+				items.append((index, values, self._element_bounds(element, self._determine_renderopts(element))))
+		for textelement in self._TEXT_ELEMENTS:
+			text = self._text_of(textelement)
+			items.append((textelement.poi, text, self._text_bounds(textelement, text)))
+		return self._damage.update(items)
+
+	def _render_textelements(self, screen, region = None):
+		profiler = self._profiler
+		current_font = None
+		for textelement in self._TEXT_ELEMENTS:
+			if profiler is not None:
+				t0 = time.perf_counter()
+			text = self._text_of(textelement)
+			if (region is not None) and (not self._in_region(self._text_bounds(textelement, text), region)):
+				continue
+			if textelement.font != current_font:
+				screen.font_select(textelement.font.name, textelement.font.size, fontcolor = self._COLORS[textelement.font.color])
+				current_font = textelement.font
+			screen.text(self._pois[textelement.poi], text, anchor = textelement.anchor)
+			if profiler is not None:
+				profiler.record("text:" + textelement.poi, time.perf_counter() - t0)
+
+	def _render_element(self, screen, element, region = None):
+		renderopts = self._determine_renderopts(element)
+		(clip, translation, rotation_rad, clipped_callback, do_draw) = renderopts
+		if not do_draw:
+			return
+		if (region is not None) and (not self._in_region(self._element_bounds(element, renderopts), region)):
+			return
+		offset = element.offset
+		if translation is not None:
+			offset += translation
+		if (clipped_callback is not None) and (self._profiler is not None):
+			clipped_callback = self._profiled_callback(element.name, clipped_callback)
+		screen.blit(element.cctx, offset = offset, clip = clip, rotation_rad = rotation_rad, center_of_rotation = element.center_of_rotation, clipped_callback = clipped_callback)
+
+	def _profiled_callback(self, name, callback):
+		def profiled(*args):
+			t0 = time.perf_counter()
+			callback(*args)
+			self._profiler.record("callback:" + name, time.perf_counter() - t0)
+		return profiled
+
+	def _update_group(self, screen, group):
+		snapshot = self._group_snapshot(group)
+		(target, rendered_snapshot) = self._group_targets.get(group.name, (None, None))
+		if target is None:
+			target = screen.create_render_target(group.bounds)
+		if rendered_snapshot != snapshot:
+			target_ctx = screen.begin_render_target(target)
+			for element in group.elements:
+				self._render_element(target_ctx, element)
+			screen.end_render_target(target)
+			self._group_targets[group.name] = (target, snapshot)
+		return target
+
+	def _render_group(self, screen, group, region = None):
+		if not self._in_region(group.bounds, region):
+			return
+		target = self._update_group(screen, group)
+		screen.blit(target.source, offset = group.bounds.base)
+
+	def prepare_render(self, screen, region = None):
+		# Brings all cached group images up to date. Afterwards render() only
+		# reads shared state, so it may run on several threads at once.
 		for element in self._elements:
-			(clip, translation, rotation_rad, clipped_callback, do_draw) = self._determine_renderopts(element)
-			if do_draw:
-				offset = element.offset
-				if translation is not None:
-					offset += translation
-				screen.blit(element.cctx, offset = offset, clip = clip, rotation_rad = rotation_rad, center_of_rotation = element.center_of_rotation, clipped_callback = clipped_callback)
+			if isinstance(element, _GCGroup) and self._in_region(element.bounds, region):
+				self._update_group(screen, element)
+
+	def render(self, screen, region = None):
+		# When a region (list of boxes) is given, only elements that
+		# intersect it are drawn; the caller is responsible for clipping.
+		# With a profiler attached, times are recorded per layer, group,
+		# clipped callback (which is included in its layer's time as well)
+		# and text element. With OpenGL they only cover building the draw
+		# batch; the GPU work happens when the batch is flushed.
+		profiler = self._profiler
+		if profiler is not None:
+			t_frame = time.perf_counter()
+		for element in self._elements:
+			if profiler is not None:
+				t0 = time.perf_counter()
+			if isinstance(element, _GCGroup):
+				self._render_group(screen, element, region)
+			else:
+				self._render_element(screen, element, region)
+			if profiler is not None:
+				profiler.record(("group:" + element.name) if isinstance(element, _GCGroup) else element.name, time.perf_counter() - t0)
 
-		self._render_textelements(screen)
+		self._render_textelements(screen, region)
+		if profiler is not None:
+			profiler.record("frame", time.perf_counter() - t_frame)
 
-	def render_cairo(self, cairo_context):
-		return self.render(cwrap.CairoContext.wrap(self._config["screen_dimension"], cairo_context))
+	def render_cairo(self, cairo_context, region = None, sprite_cache = None):
+		return self.render(cwrap.CairoContext.wrap(self._config["screen_dimension"], cairo_context, sprite_cache = sprite_cache), region)
 
-	def render_opengl(self, opengl_context):
-		return self.render(opengl_context)
+	def render_opengl(self, opengl_context, region = None):
+		return self.render(opengl_context, region)
@@ -0,0 +1,62 @@
+import math
+
+class InstrumentState(object):
+	# Flat copy of the nested instrument data plus the quantities derived from
+	# it. It is filled once per update so that per-frame code reads plain
+	# attributes instead of walking dicts and converting units for every
+	# element that uses a value.
+	__slots__ = (
+		"heading_deg", "altitude_ft", "pitch_angle_deg", "roll_angle_deg", "tas", "ias",
+		"hdgbug_deg", "obs_deg", "deviation_deg",
+		"com1_active", "com1_stby", "com2_active", "com2_stby",
+		"nav1_active", "nav1_stby", "nav2_active", "nav2_stby",
+		"squawk", "ias_bars", "utc",
+
+		# Derived values
+		"roll_rad", "compass_rad", "obs_rad", "hdgbug_rad", "deviation_clamped_deg",
+		"ias_tens", "ias_fraction",
+	)
+
+	# The course deviation indicator shows +-4 degrees
+	_MAX_DEVIATION_DEG = 4
+
+	def __init__(self):
+		for name in self.__slots__:
+			setattr(self, name, 0)
+		self.ias_bars = { }
+		self.utc = None
+		self._derive()
+
+	def update(self, data):
+		pos = data["pos"]
+		self.heading_deg = pos["heading_deg"]
+		self.altitude_ft = pos["altitude_ft"]
+		self.pitch_angle_deg = pos["pitch_angle_deg"]
+		self.roll_angle_deg = pos["roll_angle_deg"]
+		self.tas = pos["tas"]
+		self.ias = pos["ias"]
+		self.hdgbug_deg = data["ap"]["hdgbug_deg"]
+		vor1 = data["vor1"]
+		self.obs_deg = vor1["obs"]
+		self.deviation_deg = vor1["deviation_deg"]
+		freq = data["freq"]
+		(self.com1_active, self.com1_stby) = (freq["com1"]["active"], freq["com1"]["stby"])
+		(self.com2_active, self.com2_stby) = (freq["com2"]["active"], freq["com2"]["stby"])
+		(self.nav1_active, self.nav1_stby) = (freq["nav1"]["active"], freq["nav1"]["stby"])
+		(self.nav2_active, self.nav2_stby) = (freq["nav2"]["active"], freq["nav2"]["stby"])
+		self.squawk = data["xpdr"]["squawk"]
+
+		# A new dict every time, consumers may hold on to the previous one to
+		# detect changes. Recorded data may carry its own time of day.
+		self.ias_bars = { color: tuple(bar) for (color, bar) in data["ias_bars"].items() }
+		self.utc = data["clock"].get("utc") if ("clock" in data) else None
+		self._derive()
+
+	def _derive(self):
+		self.roll_rad = self.roll_angle_deg / 180 * math.pi
+		self.compass_rad = -self.heading_deg / 180 * math.pi
+		self.obs_rad = (self.obs_deg - self.heading_deg) / 180 * math.pi
+		self.hdgbug_rad = (self.hdgbug_deg - self.heading_deg) / 180 * math.pi
+		self.deviation_clamped_deg = min(max(self.deviation_deg, -self._MAX_DEVIATION_DEG), self._MAX_DEVIATION_DEG)
+		self.ias_tens = int(self.ias // 10) * 10
+		self.ias_fraction = self.ias % 10
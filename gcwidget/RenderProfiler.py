@@ -0,0 +1,40 @@
+import sys
+import collections
+
+ProfileStats = collections.namedtuple("ProfileStats", [ "name", "count", "total", "mean", "p95", "max" ])
+
+# Rolling per-item render times. Every name keeps the durations of its most
+# recent window of samples; stats() and dump() summarize them on demand.
+class RenderProfiler(object):
+	def __init__(self, window = 300):
+		self._window = window
+		self._samples = { }
+
+	def record(self, name, duration):
+		samples = self._samples.get(name)
+		if samples is None:
+			samples = collections.deque(maxlen = self._window)
+			self._samples[name] = samples
+		samples.append(duration)
+
+	def reset(self):
+		self._samples = { }
+
+	def stats(self):
+		result = [ ]
+		for (name, samples) in list(self._samples.items()):
+			samples = sorted(samples)
+			if len(samples) == 0:
+				continue
+			total = sum(samples)
+			p95 = samples[min(len(samples) - 1, (95 * len(samples)) // 100)]
+			result.append(ProfileStats(name = name, count = len(samples), total = total, mean = total / len(samples), p95 = p95, max = samples[-1]))
+		result.sort(key = lambda stat: -stat.total)
+		return result
+
+	def dump(self, f = None):
+		if f is None:
+			f = sys.stdout
+		print("%-40s %6s %9s %9s %9s" % ("Item (last %d samples)" % (self._window), "count", "mean ms", "p95 ms", "max ms"), file = f)
+		for stat in self.stats():
+			print("%-40s %6d %9.3f %9.3f %9.3f" % (stat.name, stat.count, stat.mean * 1000, stat.p95 * 1000, stat.max * 1000), file = f)
@@ -0,0 +1,64 @@
+import os
+import cwrap
+import concurrent.futures
+from geo import Vector2d, Box2d
+from .Tools import BoxTools
+
+# Renders the glass cockpit with Cairo in horizontal bands, each on its own
+# worker thread and into its own surface. pycairo drops the GIL while Cairo
+# rasterizes, so bands are drawn in parallel; they are then composited onto
+# the screen one after another.
+class TiledRenderer(object):
+	def __init__(self, glasscockpit, band_count = None):
+		if band_count is None:
+			band_count = os.cpu_count() or 1
+		self._glasscockpit = glasscockpit
+		dimension = glasscockpit.screen_dimension
+		self._bands = [ ]
+		for band in range(band_count):
+			(y0, y1) = (dimension.y * band // band_count, dimension.y * (band + 1) // band_count)
+			if y1 > y0:
+				self._bands.append(Box2d(base = Vector2d(0, y0), dimensions = Vector2d(dimension.x, y1 - y0)))
+		self._targets = None
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = len(self._bands))
+
+	@property
+	def band_count(self):
+		return len(self._bands)
+
+	def _band_region(self, band, region):
+		if region is None:
+			return [ band ]
+		band_region = [ ]
+		for box in region:
+			box = BoxTools.intersection(box, band)
+			if (box is not None) and (box.dimensions.x > 0) and (box.dimensions.y > 0):
+				band_region.append(box)
+		return band_region
+
+	def _render_band(self, screen, target, band_region):
+		band_ctx = screen.begin_render_target(target)
+		self._glasscockpit.render(band_ctx, band_region)
+		screen.end_render_target(target)
+
+	def render(self, screen, region = None):
+		if self._targets is None:
+			self._targets = [ screen.create_render_target(band) for band in self._bands ]
+		self._glasscockpit.prepare_render(screen, region)
+
+		jobs = [ ]
+		for (band, target) in zip(self._bands, self._targets):
+			band_region = self._band_region(band, region)
+			if len(band_region) > 0:
+				jobs.append((target, band_region, self._executor.submit(self._render_band, screen, target, band_region)))
+
+		for (target, band_region, future) in jobs:
+			future.result()
+			for box in band_region:
+				screen.blit(target.source, offset = target.origin, clip = box)
+
+	def render_cairo(self, cairo_context, region = None, sprite_cache = None):
+		return self.render(cwrap.CairoContext.wrap(self._glasscockpit.screen_dimension, cairo_context, sprite_cache = sprite_cache), region)
+
+	def shutdown(self):
+		self._executor.shutdown(wait = True)
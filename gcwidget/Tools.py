@@ -1,4 +1,5 @@
 import math
+from geo import Vector2d, Box2d
 
 class AngleTools(object):
 	@classmethod
@@ -9,3 +10,89 @@ class AngleTools(object):
 	def hdg2rad(cls, heading_degrees):
 		return cls.hdg2deg(heading_degrees) * math.pi / 180
 
+
+class BoxTools(object):
+	@classmethod
+	def corners(cls, box):
+		(x0, y0) = (box.base.x, box.base.y)
+		(x1, y1) = (x0 + box.dimensions.x, y0 + box.dimensions.y)
+		return (x0, y0, x1, y1)
+
+	@classmethod
+	def from_corners(cls, x0, y0, x1, y1):
+		return Box2d(base = Vector2d(x0, y0), dimensions = Vector2d(max(x1 - x0, 0), max(y1 - y0, 0)))
+
+	@classmethod
+	def union(cls, box1, box2):
+		if box1 is None:
+			return box2
+		elif box2 is None:
+			return box1
+		(ax0, ay0, ax1, ay1) = cls.corners(box1)
+		(bx0, by0, bx1, by1) = cls.corners(box2)
+		return cls.from_corners(min(ax0, bx0), min(ay0, by0), max(ax1, bx1), max(ay1, by1))
+
+	@classmethod
+	def intersection(cls, box1, box2):
+		(ax0, ay0, ax1, ay1) = cls.corners(box1)
+		(bx0, by0, bx1, by1) = cls.corners(box2)
+		if (ax1 <= bx0) or (bx1 <= ax0) or (ay1 <= by0) or (by1 <= ay0):
+			return None
+		return cls.from_corners(max(ax0, bx0), max(ay0, by0), min(ax1, bx1), min(ay1, by1))
+
+	@classmethod
+	def intersects(cls, box1, box2):
+		(ax0, ay0, ax1, ay1) = cls.corners(box1)
+		(bx0, by0, bx1, by1) = cls.corners(box2)
+		return (ax0 < bx1) and (bx0 < ax1) and (ay0 < by1) and (by0 < ay1)
+
+	@classmethod
+	def grow(cls, box, margin):
+		(x0, y0, x1, y1) = cls.corners(box)
+		return cls.from_corners(x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+
+	@classmethod
+	def snap(cls, box):
+		# Smallest box on integer coordinates that contains the given one
+		(x0, y0, x1, y1) = cls.corners(box)
+		return cls.from_corners(math.floor(x0), math.floor(y0), math.ceil(x1), math.ceil(y1))
+
+	@classmethod
+	def rotated_bounds(cls, box, center_of_rotation, rotation_rad):
+		# Axis-aligned bounding box of the box rotated around the given point
+		(x0, y0, x1, y1) = cls.corners(box)
+		(cos, sin) = (math.cos(rotation_rad), math.sin(rotation_rad))
+		(cx, cy) = (center_of_rotation.x, center_of_rotation.y)
+		xs = [ ]
+		ys = [ ]
+		for (x, y) in ((x0, y0), (x1, y0), (x1, y1), (x0, y1)):
+			(dx, dy) = (x - cx, y - cy)
+			xs.append(cx + (cos * dx) - (sin * dy))
+			ys.append(cy + (sin * dx) + (cos * dy))
+		return cls.from_corners(min(xs), min(ys), max(xs), max(ys))
+
+	@classmethod
+	def rotation_extent(cls, box, center_of_rotation):
+		# Axis-aligned box that contains the box rotated by any angle
+		(x0, y0, x1, y1) = cls.corners(box)
+		(cx, cy) = (center_of_rotation.x, center_of_rotation.y)
+		radius = max(math.sqrt(((x - cx) ** 2) + ((y - cy) ** 2)) for (x, y) in ((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
+		return cls.from_corners(cx - radius, cy - radius, cx + radius, cy + radius)
+
+	@classmethod
+	def merge(cls, boxes):
+		# Unites overlapping boxes until all remaining ones are disjoint
+		boxes = list(boxes)
+		merged = True
+		while merged:
+			merged = False
+			for i in range(len(boxes)):
+				for j in range(i + 1, len(boxes)):
+					if cls.intersects(boxes[i], boxes[j]):
+						boxes[i] = cls.union(boxes[i], boxes[j])
+						del boxes[j]
+						merged = True
+						break
+				if merged:
+					break
+		return boxes
@@ -1 +1,4 @@
 from .GlassCockpit import GlassCockpit
+from .TiledRenderer import TiledRenderer
+from .RenderProfiler import RenderProfiler
+from .InstrumentState import InstrumentState
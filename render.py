@@ -2,87 +2,193 @@
 #
 #
 
+import os
 import sys
+import atexit
+import argparse
 import geo
-import cwrap
-import gcwidget
-from GCGTKApplication import GCGTKApplication
-from GlutApplication import GlutApplication
 from FriendlyArgumentParser import FriendlyArgumentParser
 
-parser = FriendlyArgumentParser()
-parser.add_argument("-r", "--resolution", metavar = "height", type = int, default = 720, help = "Resolution to display; defaults to %(default)d.")
-parser.add_argument("-m", "--mode", choices = [ "cairo", "gl", "png" ], default = "gl", help = "Type of rendering to use. Can be Cairo, OpenGL or PNG writing. Defaults to %(default)s.")
-parser.add_argument("-f", "--fullscreen", action = "store_true", help = "Display in full screen mode.")
-args = parser.parse_args(sys.argv[1:])
-
-config = {
-	"screen_dimension":	geo.Vector2d(args.resolution * 16 // 9, args.resolution),
-}
-
-instrument_data = {
-	"pos": {
-		"heading_deg":		128,
-		"altitude_ft":		12345,
-		"pitch_angle_deg":	10,
-		"roll_angle_deg":	10,
-		"tas":				123,
-		"ias":				0,
-	},
-	"ap": {
-		"hdgbug_deg":		90,
-	},
-	"vor1": {
-		"obs":				72,
-		"deviation_deg":	0.5,
-	},
-	"freq": {
-		"com1": {
-			"active":	118.8,
-			"stby":		118.6,
+def positive_float(text):
+	value = float(text)
+	if value <= 0:
+		raise argparse.ArgumentTypeError("must be greater than zero: %s" % (text))
+	return value
+
+if __name__ == "__main__":
+	parser = FriendlyArgumentParser()
+	parser.add_argument("-r", "--resolution", metavar = "height", type = int, default = 720, help = "Resolution to display; defaults to %(default)d.")
+	parser.add_argument("-m", "--mode", choices = [ "cairo", "gl", "png", "headless", "batch", "stream" ], default = "gl", help = "Type of rendering to use. Can be Cairo, OpenGL, PNG writing, headless OpenGL rendering using Mesa's software rasterizer, batch rendering of recorded data to PNG files or streaming of raw video frames. Defaults to %(default)s.")
+	parser.add_argument("-f", "--fullscreen", action = "store_true", help = "Display in full screen mode.")
+	parser.add_argument("--fps", metavar = "rate", type = positive_float, default = 60, help = "Target frame rate for interactive modes. Defaults to %(default).0f.")
+	parser.add_argument("--vsync", choices = [ "on", "off" ], help = "Explicitly enable or disable vertical sync in OpenGL mode. Uses the driver default if omitted.")
+	parser.add_argument("--always-render", action = "store_true", help = "Render every frame even if no instrument data or the clock changed.")
+	parser.add_argument("--partial-redraw", action = "store_true", help = "In OpenGL mode, only redraw the screen area that changed since the last frame.")
+	parser.add_argument("--sprite-step", metavar = "deg", type = float, help = "In Cairo modes, draw rotating layers from a cache of pre-rotated sprites with the given angular resolution in degrees. Disabled by default.")
+	parser.add_argument("--text-cache", metavar = "kiB", type = int, help = "In Cairo modes, keep up to this much pre-rendered text and copy it instead of drawing glyphs every frame. Disabled by default.")
+	parser.add_argument("-t", "--threads", metavar = "count", type = int, help = "In Cairo modes, split the screen into this many horizontal bands that are rendered in parallel. Renders on a single thread by default.")
+	parser.add_argument("-i", "--input", metavar = "filename", help = "In batch mode, JSONL file with one instrument data snapshot per line.")
+	parser.add_argument("-o", "--output", metavar = "pattern", default = "frame_%06d.png", help = "In batch mode, filename pattern of the rendered frames. Defaults to %(default)s.")
+	parser.add_argument("-j", "--jobs", metavar = "count", type = int, help = "In batch mode, number of worker processes. Defaults to the number of CPUs.")
+	parser.add_argument("--stream-output", metavar = "filename", default = "-", help = "In stream mode, file or named pipe that raw frames are written to; '-' is stdout. Defaults to %(default)s.")
+	parser.add_argument("--no-realtime", action = "store_true", help = "In stream mode, render as fast as possible instead of pacing frames to the frame rate.")
+	parser.add_argument("--profile", action = "store_true", help = "Record render times per layer and text element. Statistics are printed when pressing 'p' in interactive modes and at the end otherwise.")
+	parser.add_argument("--trace", metavar = "filename", help = "In interactive modes, record the most recent timing spans and write them as Chrome trace events (chrome://tracing) to this file on exit.")
+	parser.add_argument("--telemetry", metavar = "address", help = "In cairo, gl and stream mode, serve frame timing statistics in Prometheus text format on this socket. Either a TCP port, host:port or unix:/path/to/socket.")
+	parser.add_argument("--overlay", action = "store_true", help = "In cairo, gl and stream mode, show frame timing statistics on screen.")
+	parser.add_argument("--listen", metavar = "host:port", help = "In cairo, gl and stream mode, receive instrument data from the simulator as UDP datagrams on this address instead of animating built-in data. E.g. 0.0.0.0:49000.")
+	parser.add_argument("--wire", choices = [ "json", "binary" ], default = "json", help = "Format of the datagrams received with --listen. Defaults to %(default)s.")
+	parser.add_argument("-n", "--frames", metavar = "count", type = int, default = 300, help = "Number of frames to render in headless and stream mode; 0 streams until interrupted. Defaults to %(default)d.")
+	args = parser.parse_args(sys.argv[1:])
+
+	if (args.mode == "stream") and (args.stream_output == "-"):
+		# stdout carries nothing but frame data; anything printed goes to
+		# stderr instead.
+		sys.stdout = sys.stderr
+
+	if args.mode == "headless":
+		# Needs to be set before anything imports PyOpenGL
+		os.environ["PYOPENGL_PLATFORM"] = "osmesa"
+
+	import cwrap
+	import gcwidget
+
+	sprite_cache = None
+	if args.sprite_step is not None:
+		sprite_cache = cwrap.CairoSpriteCache(step_deg = args.sprite_step)
+
+	if args.text_cache is not None:
+		cwrap.CairoContext.set_default_text_cache(cwrap.CairoTextCache(surface_bytes = args.text_cache * 1024))
+
+	profiler = gcwidget.RenderProfiler() if args.profile else None
+
+	span_profiler = None
+	if args.trace is not None:
+		from StopWatch import Profiler
+		span_profiler = Profiler(trace_events = 100000)
+		def write_trace():
+			span_profiler.summary(sys.stderr)
+			span_profiler.write_chrome_trace(args.trace)
+			print("Trace written to %s" % (args.trace), file = sys.stderr)
+		atexit.register(write_trace)
+
+	telemetry = None
+	if (args.telemetry is not None) or args.overlay:
+		from FrameTelemetry import FrameTelemetry, TelemetryServer
+		telemetry = FrameTelemetry(1 / args.fps, overlay = args.overlay)
+		if args.telemetry is not None:
+			telemetry_server = TelemetryServer(telemetry, args.telemetry)
+			print("Serving frame telemetry on %s" % (telemetry_server.address), file = sys.stderr)
+
+	config = {
+		"screen_dimension":	geo.Vector2d(args.resolution * 16 // 9, args.resolution),
+	}
+
+	instrument_data = {
+		"pos": {
+			"heading_deg":		128,
+			"altitude_ft":		12345,
+			"pitch_angle_deg":	10,
+			"roll_angle_deg":	10,
+			"tas":				123,
+			"ias":				0,
+		},
+		"ap": {
+			"hdgbug_deg":		90,
+		},
+		"vor1": {
+			"obs":				72,
+			"deviation_deg":	0.5,
 		},
-		"com2": {
-			"active":	121.5,
-			"stby":		122.8,
+		"freq": {
+			"com1": {
+				"active":	118.8,
+				"stby":		118.6,
+			},
+			"com2": {
+				"active":	121.5,
+				"stby":		122.8,
+			},
+			"nav1": {
+				"active":	109.9,
+				"stby":		110.9,
+			},
+			"nav2": {
+				"active":	113.25,
+				"stby":		112.95,
+			},
 		},
-		"nav1": {
-			"active":	109.9,
-			"stby":		110.9,
+		"xpdr": {
+			"squawk":			7003,
 		},
-		"nav2": {
-			"active":	113.25,
-			"stby":		112.95,
+		"ias_bars": {
+			"white":			[0, 100],		# flaps permitted until V_FE
+			"red":				[0, 60],		# stall speed V_S
+			"green":			[60, 150],		# design maneuvering speed
+			"yellow":			[150, 220],		# maximum structural crusining speed V_NO to never exceed
+			"redwhite":			[220, 9999],	# never exceed V_NE
 		},
-	},
-	"xpdr": {
-		"squawk":			7003,
-	},
-	"ias_bars": {
-		"white":			[0, 100],		# flaps permitted until V_FE
-		"red":				[0, 60],		# stall speed V_S
-		"green":			[60, 150],		# design maneuvering speed
-		"yellow":			[150, 220],		# maximum structural crusining speed V_NO to never exceed
-		"redwhite":			[220, 9999],	# never exceed V_NE
-	},
-}
-
-def modify_data():
-	instrument_data["pos"]["heading_deg"] = (instrument_data["pos"]["heading_deg"] + 0.5) % 360
-	instrument_data["pos"]["roll_angle_deg"] = (instrument_data["pos"]["roll_angle_deg"] + 0.5) % 360
-	instrument_data["pos"]["ias"] += 0.13
-	instrument_data["vor1"]["obs"] = (instrument_data["vor1"]["obs"] + 1.13) % 360
-	instrument_data["ap"]["hdgbug_deg"] = (instrument_data["ap"]["hdgbug_deg"] - 0.75) % 360
-
-if args.mode == "cairo":
-	glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext)
-	glasscockpit.feed_data(instrument_data)
-	GCGTKApplication.run(glasscockpit, 0, data_callback = modify_data)
-elif args.mode == "gl":
-	glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.OpenGLContext, img_prefix = "tex_")
-	glasscockpit.feed_data(instrument_data)
-	GlutApplication.run(glasscockpit, frametime_millis = 50, data_callback = modify_data, fullscreen = args.fullscreen)
-elif args.mode == "png":
-	screen = cwrap.CairoContext.create(geo.Vector2d(args.resolution * 16 // 9, args.resolution))
-	glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext)
-	glasscockpit.render(screen)
-	screen.write_to_png("rendering.png")
+	}
+
+	def modify_data():
+		instrument_data["pos"]["heading_deg"] = (instrument_data["pos"]["heading_deg"] + 0.5) % 360
+		instrument_data["pos"]["roll_angle_deg"] = (instrument_data["pos"]["roll_angle_deg"] + 0.5) % 360
+		instrument_data["pos"]["ias"] += 0.13
+		instrument_data["vor1"]["obs"] = (instrument_data["vor1"]["obs"] + 1.13) % 360
+		instrument_data["ap"]["hdgbug_deg"] = (instrument_data["ap"]["hdgbug_deg"] - 0.75) % 360
+		glasscockpit.feed_data(instrument_data)
+
+	data_callback = modify_data
+	if args.listen is not None:
+		from FlightDataReceiver import FlightDataReceiver
+		receiver = FlightDataReceiver(args.listen, initial_data = instrument_data, wire_format = args.wire)
+		print("Listening for instrument data on %s:%d" % receiver.address, file = sys.stderr)
+
+		def receive_data():
+			data = receiver.poll()
+			if data is not None:
+				glasscockpit.feed_data(data)
+		data_callback = receive_data
+
+	if args.mode == "cairo":
+		from GCGTKApplication import GCGTKApplication
+		glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext, profiler = profiler)
+		glasscockpit.feed_data(instrument_data)
+		GCGTKApplication.run(glasscockpit, round(1000 / args.fps), data_callback = data_callback, sprite_cache = sprite_cache, band_count = args.threads, profiler = span_profiler, telemetry = telemetry)
+	elif args.mode == "gl":
+		from GlutApplication import GlutApplication
+		glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.OpenGLContext, img_prefix = "tex_", profiler = profiler)
+		glasscockpit.feed_data(instrument_data)
+		swap_interval = { None: None, "on": 1, "off": 0 }[args.vsync]
+		GlutApplication.run(glasscockpit, frametime_millis = 1000 / args.fps, data_callback = data_callback, fullscreen = args.fullscreen, swap_interval = swap_interval, render_on_change = not args.always_render, partial_redraw = args.partial_redraw, profiler = span_profiler, telemetry = telemetry)
+	elif args.mode == "headless":
+		from OffscreenApplication import OffscreenApplication
+		glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.OpenGLContext, img_prefix = "tex_", profiler = profiler)
+		glasscockpit.feed_data(instrument_data)
+		OffscreenApplication.run(glasscockpit, frame_count = args.frames, data_callback = modify_data, png_filename = "rendering_gl.png")
+		if profiler is not None:
+			profiler.dump()
+	elif args.mode == "batch":
+		from BatchRenderer import BatchRenderer
+		if args.input is None:
+			print("Batch mode requires an input file (-i).", file = sys.stderr)
+			sys.exit(1)
+		BatchRenderer.run(config, BatchRenderer.read_snapshots(args.input), args.output, processes = args.jobs, sprite_step = args.sprite_step)
+	elif args.mode == "stream":
+		from RawVideoStreamer import RawVideoStreamer
+		glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext, profiler = profiler)
+		glasscockpit.feed_data(instrument_data)
+		streamer = RawVideoStreamer(glasscockpit, args.stream_output, args.fps, data_callback = data_callback, sprite_cache = sprite_cache, realtime = not args.no_realtime, telemetry = telemetry)
+		streamer.run(frame_count = None if (args.frames == 0) else args.frames)
+		if profiler is not None:
+			profiler.dump(sys.stderr)
+	elif args.mode == "png":
+		screen = cwrap.CairoContext.create(geo.Vector2d(args.resolution * 16 // 9, args.resolution), sprite_cache = sprite_cache)
+		glasscockpit = gcwidget.GlassCockpit(config, context_class = cwrap.CairoContext)
+		if args.threads is None:
+			glasscockpit.render(screen)
+		else:
+			renderer = gcwidget.TiledRenderer(glasscockpit, band_count = args.threads)
+			renderer.render(screen)
+			renderer.shutdown()
+		screen.write_to_png("rendering.png")
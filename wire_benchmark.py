@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+#
+#	Compares how many instrument data messages per second can be decoded from
+#	JSON and from the binary wire format of InstrumentCodec.
+#
+
+import sys
+import json
+import time
+from FriendlyArgumentParser import FriendlyArgumentParser
+from InstrumentCodec import InstrumentCodec
+
+parser = FriendlyArgumentParser()
+parser.add_argument("-n", "--messages", metavar = "count", type = int, default = 100000, help = "Number of messages decoded per format. Defaults to %(default)d.")
+parser.add_argument("-o", "--output", metavar = "filename", help = "Additionally write the results to this JSON file.")
+args = parser.parse_args(sys.argv[1:])
+
+def message(index):
+	return {
+		"pos": {
+			"heading_deg":		(128 + 0.5 * index) % 360,
+			"altitude_ft":		12345.5 + index,
+			"pitch_angle_deg":	2.25,
+			"roll_angle_deg":	-10.125,
+			"tas":				123.4,
+			"ias":				120 + index / 1000,
+		},
+		"ap": { "hdgbug_deg": 130.0 },
+		"vor1": { "obs": 72.0, "deviation_deg": 0.5 },
+		"freq": {
+			"com1":	{ "active": 118.000, "stby": 119.400 },
+			"com2":	{ "active": 120.125, "stby": 121.500 },
+			"nav1":	{ "active": 110.40, "stby": 111.20 },
+			"nav2":	{ "active": 113.25, "stby": 112.95 },
+		},
+		"xpdr": { "squawk": 7000 },
+		"ias_bars": {
+			"white":			[0, 100],
+			"red":				[0, 60],
+			"green":			[60, 150],
+			"yellow":			[150, 220],
+			"redwhite":			[220, 9999],
+		},
+	}
+
+# A small set of distinct messages is cycled through so that no decoder can
+# benefit from seeing the same bytes over and over.
+messages = [ message(index) for index in range(64) ]
+json_packets = [ json.dumps(msg).encode("utf-8") for msg in messages ]
+binary_packets = [ InstrumentCodec.encode(msg, sequence) for (sequence, msg) in enumerate(messages) ]
+
+def decode_json():
+	for i in range(args.messages):
+		json.loads(json_packets[i % len(json_packets)].decode("utf-8"))
+
+def decode_binary():
+	for i in range(args.messages):
+		InstrumentCodec.decode(binary_packets[i % len(binary_packets)])
+
+def decode_binary_into():
+	values = InstrumentCodec.create_values()
+	for i in range(args.messages):
+		InstrumentCodec.decode_into(binary_packets[i % len(binary_packets)], values)
+
+def decode_binary_into_data():
+	values = InstrumentCodec.create_values()
+	data = { }
+	bindings = InstrumentCodec.bind(data)
+	for i in range(args.messages):
+		InstrumentCodec.decode_into(binary_packets[i % len(binary_packets)], values)
+		InstrumentCodec.values_to_data(values, data, bindings)
+
+benchmarks = [
+	("json", "JSON to new dicts", json_packets, decode_json),
+	("binary", "binary to new dicts", binary_packets, decode_binary),
+	("binary_into", "binary into preallocated array", binary_packets, decode_binary_into),
+	("binary_into_data", "binary into existing dicts", binary_packets, decode_binary_into_data),
+]
+
+results = [ ]
+for (name, description, packets, function) in benchmarks:
+	t0 = time.perf_counter()
+	function()
+	tdiff = time.perf_counter() - t0
+	result = {
+		"name":				name,
+		"message_bytes":	sum(len(packet) for packet in packets) / len(packets),
+		"messages_per_sec":	args.messages / tdiff,
+		"usec_per_message":	tdiff / args.messages * 1e6,
+	}
+	results.append(result)
+	print("%-32s %6.0f bytes  %10.0f msgs/s  %6.2f µs/msg" % (description, result["message_bytes"], result["messages_per_sec"], result["usec_per_message"]))
+
+if args.output is not None:
+	with open(args.output, "w") as f:
+		json.dump(results, f, indent = 4)
+		f.write("\n")